@@ -0,0 +1,119 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""Measure the encoding throughput of `onegeo_manager.bulk.BulkEncoder`.
+
+Documents are encoded into bulk request bodies, as with `json.dumps` for
+the action and source lines of every document, then with the encoder for
+every JSON backend.
+
+    python benchmarks/bulk_benchmark.py [scale]
+"""
+
+
+from base64 import b64encode
+import json
+from onegeo_manager.bulk import BulkEncoder
+from onegeo_manager import codec
+import os
+import random
+import sys
+import time
+
+
+LINEAGE = {'resource': {'name': 'parcelles'},
+           'source': {'protocol': 'wfs', 'uri': 'https://hostname/wfs'}}
+
+
+def point_document(i):
+    return {
+        '_backup': {}, '_md5': '{0:032x}'.format(i), 'lineage': LINEAGE,
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [4.8 + random.random(), 45.7 + random.random()]},
+        'properties': {
+            'id': i, 'nom': 'Arrêt {0}'.format(i), 'ligne': ['C1', 'C2'],
+            'pmr': True, 'date_maj': '2019-03-01T10:00:00Z'}}
+
+
+def polygon_document(i, vertices=500):
+    ring = [[4.8 + random.random() / 100, 45.7 + random.random() / 100]
+            for _ in range(vertices - 1)]
+    return {
+        '_backup': {}, '_md5': '{0:032x}'.format(i), 'lineage': LINEAGE,
+        'geometry': {'type': 'Polygon', 'coordinates': [ring + ring[:1]]},
+        'properties': {'id': i, 'commune': 'Villeurbanne'}}
+
+
+def pdf_document(i, size=2 ** 20):
+    return {
+        '_backup': {}, '_md5': '{0:032x}'.format(i),
+        'lineage': dict(LINEAGE, filename='document_{0}.pdf'.format(i)),
+        'properties': {'Title': 'Document {0}'.format(i)},
+        '_raw': b64encode(os.urandom(size)).decode('utf-8')}
+
+
+SHAPES = (
+    ('point', point_document, 20000), ('polygon', polygon_document, 500),
+    ('pdf', pdf_document, 20))
+
+
+def dumps_requests(documents, max_docs=1000):
+    # Two json.dumps calls per document, then the body of the requests
+    lines = []
+    for document in documents:
+        lines.append(json.dumps({'index': {
+            '_index': 'idx', '_type': 'idx', '_id': document['_md5']}}))
+        lines.append(json.dumps(document))
+        if len(lines) >= 2 * max_docs:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def measure(fun, documents):
+    start = time.perf_counter()
+    size = sum(len(body) for body in fun(iter(documents)))
+    return time.perf_counter() - start, size
+
+
+def report(name, encoder, documents, elapsed, size):
+    print('{0:<10}{1:<16}{2:>12.0f}{3:>12.1f}'.format(
+        name, encoder, len(documents) / elapsed, size / elapsed / 2 ** 20))
+
+
+def run(scale):
+    print('{0:<10}{1:<16}{2:>12}{3:>12}'.format(
+        'shape', 'encoder', 'docs/s', 'MB/s'))
+
+    encoder = BulkEncoder('idx', doc_type='idx', id='_md5')
+    for name, shape, number in SHAPES:
+        documents = [shape(i) for i in range(max(1, int(number * scale)))]
+        report(name, 'json.dumps', documents,
+               *measure(dumps_requests, documents))
+        for backend in codec.BACKENDS:
+            try:
+                codec.set_backend(backend)
+            except ImportError:
+                continue
+            report(name, 'bulk/' + backend, documents,
+                   *measure(encoder.iter_requests, documents))
+    codec.set_backend()
+
+
+if __name__ == '__main__':
+    run(len(sys.argv) > 1 and float(sys.argv[1]) or 1)
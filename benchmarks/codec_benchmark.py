@@ -0,0 +1,93 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+"""Compare the JSON backends of `onegeo_manager.codec` on feature shapes.
+
+    python benchmarks/codec_benchmark.py [number]
+"""
+
+
+from collections import OrderedDict
+import json
+from onegeo_manager import codec
+import random
+import sys
+import timeit
+
+
+def point_feature(i):
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [4.8 + random.random(), 45.7 + random.random()]},
+        'properties': {
+            'id': i, 'nom': 'Arrêt {0}'.format(i), 'code': 'TCL{0}'.format(i),
+            'ligne': ['C1', 'C2'], 'pmr': True, 'altitude': 172.5,
+            'date_maj': '2019-03-01T10:00:00Z', 'commentaire': None}}
+
+
+def polygon_feature(i, vertices=500):
+    ring = [[4.8 + random.random() / 100, 45.7 + random.random() / 100]
+            for _ in range(vertices - 1)]
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Polygon', 'coordinates': [ring + ring[:1]]},
+        'properties': {
+            'id': i, 'commune': 'Villeurbanne', 'section': 'AB',
+            'surface': random.random() * 1e4}}
+
+
+def wfs_record(i):
+    # As parsed from GML: ordered, with string values
+    return OrderedDict([
+        ('@gml:id', 'parcelle.{0}'.format(i)), ('ms:gid', str(i)),
+        ('ms:nom', 'Parcelle {0}'.format(i)), ('ms:surface', '1234.5'),
+        ('ms:date_modification', '2019-01-01'), ('ms:observation', None)])
+
+
+SHAPES = (
+    ('point', point_feature), ('polygon', polygon_feature),
+    ('wfs', wfs_record))
+
+
+def run(number):
+    print('{0:<10}{1:<10}{2:>12}{3:>16}'.format(
+        'shape', 'backend', 'loads (us)', 'canonical (us)'))
+
+    for name, shape in SHAPES:
+        records = [shape(i) for i in range(number)]
+        texts = [json.dumps(r).encode() for r in records]
+        codec.set_backend('json')
+        expected = [codec.canonical(r) for r in records]
+
+        for backend in codec.BACKENDS:
+            try:
+                codec.set_backend(backend)
+            except ImportError:
+                continue
+            assert [codec.canonical(r) for r in records] == expected
+            loads = timeit.timeit(
+                lambda: [codec.loads(t) for t in texts], number=3) / 3
+            canonical = timeit.timeit(
+                lambda: [codec.canonical(r) for r in records], number=3) / 3
+            print('{0:<10}{1:<10}{2:>12.1f}{3:>16.1f}'.format(
+                name, backend, loads / number * 1e6,
+                canonical / number * 1e6))
+
+
+if __name__ == '__main__':
+    run(len(sys.argv) > 1 and int(sys.argv[1]) or 2000)
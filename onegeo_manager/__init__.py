@@ -18,6 +18,9 @@ __version__ = '0.2.0dev'
 
 
 import itertools
+from onegeo_manager.bulk import *
+from onegeo_manager.fingerprint import *
+from onegeo_manager.geometry import *
 from onegeo_manager.index_profile import *
 from onegeo_manager import protocol
 from onegeo_manager.resource import *
@@ -25,4 +28,6 @@ from onegeo_manager.source import *
 
 
 __all__ = list(itertools.chain(
-    index_profile.__all__, protocol.__all__, resource.__all__, source.__all__))
+    bulk.__all__, fingerprint.__all__, geometry.__all__,
+    index_profile.__all__, protocol.__all__, resource.__all__,
+    source.__all__))
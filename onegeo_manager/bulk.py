@@ -0,0 +1,257 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from onegeo_manager.codec import dumps
+
+
+__all__ = ['BulkEncoder']
+
+
+BULK_MAX_DOCS = 1000
+
+BULK_MAX_BYTES = 5 * 2 ** 20
+
+ACTIONS = ('create', 'index')
+
+# The characters written as they are in a JSON string: printable ASCII
+# characters but the quotation mark and the reverse solidus
+SAFE = bytes(c for c in range(0x20, 0x7f) if c not in b'"\\')
+
+
+def _member(path):
+    names = path.split('.')
+
+    def get(document):
+        for name in names:
+            document = document.get(name)
+            if document is None:
+                return None
+        return document
+    return get
+
+
+class BulkEncoder(object):
+    """Encode documents into the bodies of Elasticsearch bulk requests.
+
+    Every document gives an action line and a source line (NDJSON). The
+    `_id` of a document is read from `id`, a member name (dotted for
+    nested members, '_md5' for instance) or a function of the document.
+    Elasticsearch generates the ids otherwise.
+
+    The `raw` members (base64 strings such as the '_raw' member of PDF
+    documents) are not serialized: they are checked and spliced as they
+    are into the source line, which saves the escaping of `json.dumps`.
+    They are still copied, when a string is encoded to bytes and when the
+    body of the request is joined. Values that are not made of safe
+    characters (see `SAFE`) are serialized as usual.
+
+    Request bodies hold `max_docs` documents and `max_bytes` bytes at
+    most, see `Batcher`.
+    """
+
+    def __init__(self, index, doc_type=None, action='index', id=None,
+                 pipeline=None, raw=('_raw',), max_docs=BULK_MAX_DOCS,
+                 max_bytes=BULK_MAX_BYTES):
+        if action not in ACTIONS:
+            raise ValueError("Unexpected bulk action '{0}'.".format(action))
+
+        meta = {'_index': index}
+        if doc_type:
+            meta['_type'] = doc_type
+        if pipeline:
+            meta['pipeline'] = pipeline
+        self._line = dumps({action: meta}) + b'\n'
+        # The id is the last member of the action metadata
+        self._prefix = self._line[:-3] + b',"_id":'
+
+        if id is None or callable(id):
+            self._id = id
+        else:
+            self._id = _member(id)
+        self.raw = tuple(raw or ())
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+
+    def encode(self, document):
+        """Return the lines of a document as a list of bytes-like parts."""
+        parts = self._action(document)
+        parts.extend(self._source(document))
+        parts.append(b'\n')
+        return parts
+
+    def _action(self, document):
+        value = self._id and self._id(document)
+        if value is None or value == '':
+            return [self._line]
+        return [self._prefix, dumps(str(value)), b'}}\n']
+
+    def _source(self, document):
+        spliced = []
+        for name in self.raw:
+            value = document.get(name)
+            if type(value) is str:
+                try:
+                    value = value.encode('ascii')
+                except UnicodeEncodeError:
+                    continue
+            elif not isinstance(value, (bytes, bytearray)):
+                continue
+            # Nothing is left once the safe characters are deleted
+            if not value.translate(None, SAFE):
+                spliced.append((name, value))
+        if not spliced:
+            return [dumps(document)]
+
+        names = [name for name, _ in spliced]
+        parts = [b'{']
+        for name, value in spliced:
+            parts.extend((dumps(name), b':"', value, b'",'))
+        body = dumps(
+            {k: v for k, v in document.items() if k not in names})
+        if body == b'{}':
+            parts[-1] = b'"}'
+        else:
+            parts.append(memoryview(body)[1:])
+        return parts
+
+    def iter_requests(self, documents):
+        """Yield the request bodies of a (possibly asynchronous) collection."""
+        batches = batch_collection(documents, self)
+        if hasattr(batches, '__aiter__'):
+            async def wrapper():
+                async for batch in batches:
+                    yield batch.body()
+            return wrapper()
+        return (batch.body() for batch in batches)
+
+
+class Batch(list):
+    """Documents of a bulk request, along with their encoded lines."""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.size = 0
+        self._commit = None
+
+    def body(self):
+        """Return the body of the bulk request."""
+        return b''.join(self.parts)
+
+    def commit(self):
+        """Commit the checkpoint of the pages ending in the batch."""
+        self._commit and self._commit()
+
+
+class Batcher(object):
+    """Group documents into batches sized for bulk indexing.
+
+    Documents are encoded once by `encoder` (a `BulkEncoder`) when they
+    are added. A batch holds `max_docs` documents and `max_bytes` bytes of
+    bulk request lines at most. A document larger than `max_bytes` makes a
+    batch on its own.
+
+    Documents are added by pages (the pages of a server for instance),
+    which are kept whole in a batch unless a page does not fit in a batch
+    on its own.
+
+    The commits of a `checkpoint.Checkpoint` are deferred: a completed
+    batch commits the pages committed before it was completed, which are
+    all held by the batch or by the batches before it. The last pages of a
+    batch are thus committed with the next batch, and sent again if the
+    harvest is resumed in between.
+    """
+
+    def __init__(self, encoder, max_docs=BULK_MAX_DOCS,
+                 max_bytes=BULK_MAX_BYTES, checkpoint=None):
+        self.encoder = encoder
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.checkpoint = checkpoint
+        checkpoint and checkpoint.defer()
+        self.batch = Batch()
+
+    def add(self, documents):
+        """Add a page of documents, and return the batches completed."""
+        encoded = []
+        size = 0
+        for document in documents:
+            parts = self.encoder.encode(document)
+            encoded.append((document, parts, sum(map(len, parts))))
+            size += encoded[-1][2]
+
+        completed = []
+        if self.batch and (
+                self.max_bytes and self.batch.size + size > self.max_bytes
+                or self.max_docs
+                and len(self.batch) + len(encoded) > self.max_docs):
+            completed.append(self.flush())
+        for document, parts, size in encoded:
+            if self.batch and self.max_bytes \
+                    and self.batch.size + size > self.max_bytes:
+                completed.append(self.flush())
+            self.batch.append(document)
+            self.batch.parts.extend(parts)
+            self.batch.size += size
+            if self.max_docs and len(self.batch) >= self.max_docs:
+                completed.append(self.flush())
+        return completed
+
+    def flush(self):
+        batch, self.batch = self.batch, Batch()
+        batch._commit = self.checkpoint and self.checkpoint.release()
+        return batch
+
+    def release(self):
+        """Apply the commits left once every batch has been consumed."""
+        self.checkpoint and self.checkpoint.release()()
+
+
+def batch_collection(collection, encoder, max_docs=BULK_MAX_DOCS,
+                     max_bytes=BULK_MAX_BYTES, pages=False, checkpoint=None):
+    """Yield the documents of a (possibly asynchronous) collection by batches.
+
+    If `pages` is true, the items of the collection are lists of
+    documents, see `Batcher`. The pages are committed to `checkpoint` once
+    the batch holding them has been consumed, that is when the next batch
+    is requested.
+    """
+    batcher = Batcher(encoder, max_docs=max_docs, max_bytes=max_bytes,
+                      checkpoint=checkpoint)
+    if hasattr(collection, '__aiter__'):
+        async def wrapper():
+            async for item in collection:
+                for batch in batcher.add(item if pages else (item,)):
+                    yield batch
+                    batch.commit()
+            if batcher.batch:
+                batch = batcher.flush()
+                yield batch
+                batch.commit()
+            batcher.release()
+        return wrapper()
+
+    def wrapper():
+        for item in collection:
+            for batch in batcher.add(item if pages else (item,)):
+                yield batch
+                batch.commit()
+        if batcher.batch:
+            batch = batcher.flush()
+            yield batch
+            batch.commit()
+        batcher.release()
+    return wrapper()
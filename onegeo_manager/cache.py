@@ -0,0 +1,276 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+from pathlib import Path
+import pickle
+import tempfile
+import threading
+import time
+
+
+class CacheEntry(object):
+
+    def __init__(self, value, etag=None, last_modified=None, stored=None,
+                 size=0):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored or time.time()
+        self.size = size
+
+    @classmethod
+    def from_response(cls, value, response, size=0):
+        return cls(value, etag=response.headers.get('ETag'),
+                   last_modified=response.headers.get('Last-Modified'),
+                   size=size)
+
+    def revalidated(self):
+        """Return a fresh copy of the entry (not modified upstream)."""
+        return CacheEntry(self.value, etag=self.etag,
+                          last_modified=self.last_modified, size=self.size)
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class MemoryStore(object):
+    """Thread-safe LRU store, bounded by a number of entries and
+    optionally by the total `size` of the entries."""
+
+    def __init__(self, maxsize=32, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, entry):
+        with self._lock:
+            self._pop(key)
+            self._data[key] = entry
+            self._bytes += getattr(entry, 'size', 0)
+            while len(self._data) > self.maxsize or (
+                    self.maxbytes and self._bytes > self.maxbytes
+                    and len(self._data) > 1):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= getattr(entry, 'size', 0)
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+
+class DiskStore(object):
+    """Store entries as pickle files in a directory."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / '{0}.pickle'.format(key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupted or incompatible entry
+            self.delete(key)
+            return None
+
+    def set(self, key, entry):
+        # Write then rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=str(self.directory), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, str(self._path(key)))
+        except Exception:
+            os.path.exists(tmp) and os.remove(tmp)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(str(self._path(key)))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for p in self.directory.glob('*.pickle'):
+            p.unlink()
+
+
+class CapabilitiesCache(object):
+    """Two-level (in-memory LRU then on-disk) cache of capabilities.
+
+    Entries younger than `ttl` seconds are returned as is. Older entries
+    are revalidated with a conditional request (ETag / Last-Modified)
+    and are only downloaded and parsed again if they have changed.
+    """
+
+    def __init__(self, maxsize=32, directory=None, ttl=300):
+        self.ttl = ttl
+        self.memory = MemoryStore(maxsize=maxsize)
+        self.disk = directory and DiskStore(directory) or None
+
+    @staticmethod
+    def key(url, version=None, username=None, password=None):
+        credentials = username and hashlib.sha256('{0}:{1}'.format(
+            username, password or '').encode('utf-8')).hexdigest() or None
+        return hashlib.sha256(json.dumps(
+            [url, version, credentials]).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self.memory.set(key, entry)
+        if self.disk:
+            self.disk.set(key, entry)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def is_fresh(self, entry):
+        return time.time() - entry.stored < self.ttl
+
+    def fetch(self, key, load):
+        """Return the cached value of `key`, (re)loading it if needed.
+
+        `load` is called with the conditional request headers and should
+        return a new `CacheEntry`, or None if the resource has not been
+        modified (HTTP 304).
+        """
+        entry = self.get(key)
+        if entry is not None and self.is_fresh(entry):
+            return entry.value
+
+        new_entry = load(entry and entry.conditional_headers() or {})
+        if new_entry is None:
+            if entry is None:
+                raise ValueError('Nothing to revalidate.')
+            new_entry = entry.revalidated()
+        self.set(key, new_entry)
+        return new_entry.value
+
+    async def afetch(self, key, load):
+        """Coroutine counterpart of `fetch`, `load` returns an awaitable."""
+        entry = self.get(key)
+        if entry is not None and self.is_fresh(entry):
+            return entry.value
+
+        new_entry = await load(entry and entry.conditional_headers() or {})
+        if new_entry is None:
+            if entry is None:
+                raise ValueError('Nothing to revalidate.')
+            new_entry = entry.revalidated()
+        self.set(key, new_entry)
+        return new_entry.value
+
+
+class DocumentCache(CapabilitiesCache):
+    """In-memory LRU cache of the documents of the JSON sources.
+
+    The documents are kept as read (decompressed), not parsed, so that
+    every caller decodes its own copy, and the cache is bounded by their
+    total size. Local files are revalidated by modification time and
+    size on every access, HTTP documents as the capabilities are.
+    """
+
+    def __init__(self, maxsize=64, maxbytes=256 * 2 ** 20, ttl=300):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.memory = MemoryStore(maxsize=maxsize, maxbytes=maxbytes)
+
+    def fetch_file(self, path, read):
+        """Return the cached content of a file, calling `read` if needed."""
+        path = Path(path).resolve()
+        st = path.stat()
+        validator = '{0}-{1}'.format(st.st_mtime_ns, st.st_size)
+
+        key = self.key(path.as_uri())
+        entry = self.get(key)
+        if entry is not None and entry.etag == validator:
+            return entry.value
+
+        content = read()
+        self.set(key, CacheEntry(content, etag=validator, size=len(content)))
+        return content
+
+
+_default_cache = CapabilitiesCache()
+
+_default_document_cache = DocumentCache()
+
+
+def get_default_cache():
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """Replace the cache used by the sources, or disable it with None."""
+    global _default_cache
+    _default_cache = cache
+
+
+def get_default_document_cache():
+    return _default_document_cache
+
+
+def set_default_document_cache(cache):
+    """Replace the cache used by the JSON sources, or disable it with None."""
+    global _default_document_cache
+    _default_document_cache = cache
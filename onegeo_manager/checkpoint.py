@@ -0,0 +1,216 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import json
+from onegeo_manager.utils import digest_object
+import os
+from pathlib import Path
+import tempfile
+import time
+
+
+class CheckpointStore(object):
+    """Store checkpoints as small JSON files in a directory."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / '{0}.json'.format(key)
+
+    def load(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, state):
+        # Write then rename so that a crash never leaves a partial file
+        fd, tmp = tempfile.mkstemp(dir=str(self.directory), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, str(self._path(key)))
+        except Exception:
+            os.path.exists(tmp) and os.remove(tmp)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(str(self._path(key)))
+        except FileNotFoundError:
+            pass
+
+
+class Checkpoint(object):
+    """Paging cursor of a harvest, committed every `interval` pages.
+
+    A harvest bound to the same source, resource and parameters resumes
+    from the last committed cursor, unless the record found just before
+    the cursor is no longer the last record committed (see `check`). The
+    checkpoint is deleted once the harvest is complete.
+    """
+
+    def __init__(self, store, interval=1):
+        self.store = store
+        self.interval = interval
+        self.key = None
+        self.state = None
+        self._pages = 0
+        self._deferred = None
+
+    def bind(self, uri, resource, params):
+        """Bind the checkpoint to a harvest and return the saved cursor."""
+        self.key = digest_object(
+            {'uri': uri, 'resource': resource, 'params': params})
+        self.state = self.store.load(self.key) or {
+            'uri': uri,
+            'resource': resource,
+            'params': dict(params),
+            'cursor': None,
+            'last_digest': None}
+        self._pages = 0
+        return self.state['cursor']
+
+    def check(self, record):
+        """Return the saved cursor if `record`, read just before it, is
+        the last record committed.
+
+        Otherwise the records have changed since (or `record` is None)
+        and the cursor is reset: None is returned.
+        """
+        last_digest = self.state['last_digest']
+        if last_digest is None or (
+                record is not None and digest_object(record) == last_digest):
+            return self.state['cursor']
+        self.state.update(cursor=None, last_digest=None)
+        return None
+
+    @property
+    def cursor(self):
+        return self.state and self.state['cursor']
+
+    @property
+    def last_digest(self):
+        return self.state and self.state['last_digest']
+
+    def defer(self):
+        """Queue the commits (and the completion) until they are released.
+
+        The pages of a batched harvest are thus committed once the batch
+        holding them has been consumed, see `release`.
+        """
+        self._deferred = []
+
+    def release(self):
+        """Return a function applying the commits queued so far."""
+        deferred = self._deferred or []
+        if self._deferred is not None:
+            self._deferred = []
+
+        def apply():
+            for args in deferred:
+                if args is None:
+                    self.store.delete(self.key)
+                else:
+                    self._commit(*args)
+        return apply
+
+    def commit(self, cursor, last_record=None, force=False):
+        """Record that every feature before `cursor` has been consumed."""
+        if self._deferred is not None:
+            self._deferred.append((cursor, last_record, force))
+        else:
+            self._commit(cursor, last_record, force)
+
+    def _commit(self, cursor, last_record, force):
+        self.state['cursor'] = cursor
+        if last_record is not None:
+            self.state['last_digest'] = digest_object(last_record)
+        self._pages += 1
+        if force or self._pages % self.interval == 0:
+            self.state['updated'] = time.time()
+            self.store.save(self.key, self.state)
+
+    def done(self):
+        if self._deferred is not None:
+            self._deferred.append(None)
+        else:
+            self.store.delete(self.key)
+
+
+class Watermark(object):
+    """Greatest value of a property ("modified since") of a resource.
+
+    Harvests bound to the watermark only request the records whose
+    `property` is greater than `value`, which is updated and saved once a
+    harvest is complete, so an interrupted harvest starts over from the
+    previous watermark. Without a store, `value` must be kept by the
+    caller.
+    """
+
+    def __init__(self, property, value=None, store=None):
+        self.property = property
+        self.value = value
+        self.store = store
+        self.key = None
+        self._max = value
+
+    def bind(self, uri, resource):
+        """Bind the watermark to a harvest and return its value."""
+        self.key = digest_object(
+            {'uri': uri, 'resource': resource, 'property': self.property})
+        state = self.store and self.store.load(self.key)
+        if state and self.value is None:
+            self.value = state['value']
+        self._max = self.value
+        return self.value
+
+    def update(self, record):
+        properties = record.get('properties', record)
+        # GML properties are stored by local name
+        value = properties.get(self.property.split(':')[-1])
+        if value is not None and (self._max is None or value > self._max):
+            self._max = value
+
+    def commit(self):
+        self.value = self._max
+        if self.store and self.value is not None:
+            self.store.save(self.key, {
+                'property': self.property,
+                'updated': time.time(),
+                'value': self.value})
+
+    def track(self, records, by_page=False):
+        """Yield `records` and commit the new watermark at the end.
+
+        If `by_page` is true, the items of `records` are lists of records.
+        """
+        for item in records:
+            for record in item if by_page else (item,):
+                self.update(record)
+            yield item
+        self.commit()
+
+    async def atrack(self, records, by_page=False):
+        """Asynchronous counterpart of `track`."""
+        async for item in records:
+            for record in item if by_page else (item,):
+                self.update(record)
+            yield item
+        self.commit()
@@ -0,0 +1,210 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from importlib import import_module
+import json
+import os
+import re
+
+
+__all__ = ['canonical', 'dumps', 'loads', 'loads_response', 'response_body',
+           'set_backend']
+
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+BOM = b'\xef\xbb\xbf'
+
+# Maps the digits to '0' and the other bytes to ' '
+DIGITS = bytes(48 if 48 <= i <= 57 else 32 for i in range(256))
+
+LONG_INTEGER = 19  # Number of digits from which orjson may return a float
+
+SCAN_SIZE = 65536  # Bytes translated at once when looking for long integers
+
+# orjson writes the floats of magnitude 1e-5 to 1e-9 unlike `float.__repr__`
+# ('0.00001' or '1e-6' instead of '1e-05' or '1e-06')
+SHORT_EXPONENT = re.compile(rb'\de-\d(?!\d)')
+
+# Some orjson versions write the floats of magnitude 1e16 or more without
+# the sign of the exponent ('1e16' instead of '1e+16')
+UNSIGNED_EXPONENT = re.compile(rb'\de\d')
+
+backend = None
+
+_module = None
+
+_compact = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def set_backend(name=None):
+    """Select the JSON backend, the fastest installed one by default.
+
+    The backend is first selected from the ONEGEO_JSON_BACKEND environment
+    variable. Its name is kept in `backend`.
+    """
+    global backend, _module
+    for candidate in name and (name,) or BACKENDS:
+        try:
+            _module = import_module(candidate)
+        except ImportError:
+            if name:
+                raise
+            continue
+        backend = candidate
+        return backend
+
+
+def _as_buffer(data):
+    if isinstance(data, str):
+        return data.startswith('\ufeff') and data[1:] or data
+    # Buffers (memory-mapped files for instance) are not copied
+    if not isinstance(data, (bytes, bytearray)):
+        data = memoryview(data)
+    if data[:3] == BOM:
+        data = memoryview(data)[3:]
+    return data
+
+
+def _has_long_integers(data):
+    """Tell whether a document may hold integers over 64 bits.
+
+    Buffers are scanned by windows of `SCAN_SIZE` bytes, so that a
+    document is not copied as a whole.
+    """
+    if isinstance(data, str):
+        return re.search('\\d{%d}' % LONG_INTEGER, data) is not None
+    view = memoryview(data)
+    digits = b'0' * LONG_INTEGER
+    # Windows overlap so that no number is cut
+    for i in range(0, len(view), SCAN_SIZE):
+        window = bytes(view[i:i + SCAN_SIZE + LONG_INTEGER - 1])
+        if digits in window.translate(DIGITS):
+            return True
+    return False
+
+
+def loads(data):
+    """Decode a JSON document given as str, bytes or any buffer."""
+    data = _as_buffer(data)
+    # orjson decodes the integers over 64 bits as floats
+    if backend == 'ujson' or (
+            backend == 'orjson' and not _has_long_integers(data)):
+        try:
+            # orjson reads any buffer, ujson does not
+            return _module.loads(
+                bytes(data) if backend == 'ujson'
+                and isinstance(data, memoryview) else data)
+        except ValueError:
+            # NaN, Infinity or very large numbers for instance, which the
+            # standard library accepts
+            pass
+    return json.loads(
+        bytes(data) if isinstance(data, memoryview) else data)
+
+
+def response_body(r):
+    """Return the body of an HTTP response, as text unless it is UTF-8."""
+    s = re.search('charset=([\\w-]+)', r.headers.get('Content-Type', ''))
+    if s and s.group(1).lower() not in ('utf-8', 'utf8'):
+        return r.text
+    return r.content
+
+
+def loads_response(r):
+    """Decode the JSON body of an HTTP response."""
+    return loads(response_body(r))
+
+
+def _has_non_finite(obj):
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        kind = type(obj)
+        if kind is str or kind is int:
+            continue
+        if kind is list:
+            stack.extend(obj)
+        elif kind is dict:
+            stack.extend(obj.values())
+        elif isinstance(obj, float):
+            # True for NaN and infinite floats only
+            if obj - obj != 0:
+                return True
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+    return False
+
+
+def _orjson_canonical(obj):
+    try:
+        s = _module.dumps(obj, option=(
+            _module.OPT_SORT_KEYS | _module.OPT_PASSTHROUGH_DATACLASS
+            | _module.OPT_PASSTHROUGH_DATETIME))
+    except TypeError:
+        # Integers over 64 bits, keys that are not strings...
+        return None
+    if b'0.0000' in s or b'e' in s and (
+            SHORT_EXPONENT.search(s) or UNSIGNED_EXPONENT.search(s)):
+        return None
+    # NaN and infinite floats are written as null
+    if b'null' in s and _has_non_finite(obj):
+        return None
+    return s
+
+
+def canonical(obj):
+    """Return the canonical UTF-8 JSON serialization of `obj`.
+
+    Whatever the backend, the output is the one of `json.dumps(obj,
+    ensure_ascii=False, separators=(',', ':'), sort_keys=True)` encoded in
+    UTF-8, so that digests do not depend on the backend.
+    """
+    if backend == 'orjson':
+        s = _orjson_canonical(obj)
+        if s is not None:
+            return s
+    return json.dumps(
+        obj, skipkeys=False, ensure_ascii=False, check_circular=True,
+        allow_nan=True, cls=None, indent=None, separators=(',', ':'),
+        default=None, sort_keys=True).encode('utf-8')
+
+
+def dumps(obj):
+    """Return the compact UTF-8 JSON serialization of `obj`.
+
+    Unlike `canonical`, keys are not sorted and the output may depend on
+    the backend (NaN and infinite floats are written as null by orjson).
+    """
+    if backend == 'orjson':
+        try:
+            return _module.dumps(obj)
+        except TypeError:
+            # Integers over 64 bits, keys that are not strings...
+            pass
+    elif backend == 'ujson':
+        try:
+            return _module.dumps(
+                obj, ensure_ascii=False, escape_forward_slashes=False
+            ).encode('utf-8')
+        except (TypeError, OverflowError):
+            pass
+    return _compact.encode(obj).encode('utf-8')
+
+
+set_backend(os.environ.get('ONEGEO_JSON_BACKEND'))
@@ -51,3 +51,8 @@ class NotYetImplemented(GenericException):
 class DuplicateColumnError(GenericException):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+
+
+class CircuitOpenError(GenericException):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
@@ -0,0 +1,272 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import bz2
+from contextlib import contextmanager
+import gzip
+import io
+import lzma
+import mmap
+import os
+import zlib
+
+
+CHUNK_SIZE = 65536
+
+MMAP_THRESHOLD = 2 ** 20
+
+COMPRESSION_EXTENSIONS = {
+    '.bz2': 'bz2', '.gz': 'gzip', '.lzma': 'lzma', '.xz': 'xz'}
+
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'))
+
+MAGIC_LENGTH = 6
+
+DECOMPRESSORS = {
+    'bz2': bz2.BZ2Decompressor,
+    'gzip': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    'lzma': lambda: lzma.LZMADecompressor(lzma.FORMAT_ALONE),
+    'xz': lambda: lzma.LZMADecompressor(lzma.FORMAT_XZ)}
+
+OPENERS = {
+    'bz2': bz2.open,
+    'gzip': gzip.open,
+    'lzma': lambda path: lzma.open(path, format=lzma.FORMAT_ALONE),
+    'xz': lzma.open}
+
+
+def guess_compression(name=None, head=None):
+    """Return the compression of a stream, or None if it is not compressed.
+
+    The compression is given by the first bytes of the stream. The name
+    is only relied on when these are not known, or for the legacy .lzma
+    format which has no magic number.
+    """
+    if head is not None:
+        for magic, compression in COMPRESSION_MAGIC:
+            if bytes(head[:len(magic)]) == magic:
+                return compression
+    compression = name and COMPRESSION_EXTENSIONS.get(
+        os.path.splitext(str(name))[1].lower())
+    if head is None or compression == 'lzma':
+        return compression
+    return None
+
+
+class Decompressor(object):
+    """Incremental decompression of a stream read by chunks.
+
+    The compression (gzip, bzip2, xz or lzma) is detected from the first
+    bytes of the stream, see `guess_compression`. Streams that are not
+    compressed are passed through.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.compression = None
+        self._head = b''
+        self._sniffed = False
+        self._obj = None
+
+    def feed(self, data):
+        """Return the data decompressed from `data`."""
+        if not self._sniffed:
+            self._head += bytes(data)
+            if len(self._head) < MAGIC_LENGTH:
+                return b''
+            data = self._sniff()
+        if self.compression is None:
+            return data
+        return self._decompress(data)
+
+    def close(self):
+        """Return the last data and check the stream is complete."""
+        data = b''
+        if not self._sniffed:
+            data = self._sniff()
+            if self.compression is not None:
+                data = self._decompress(data)
+        if self._obj is not None and not self._obj.eof:
+            raise EOFError('Compressed stream ended before the '
+                           'end-of-stream marker was reached')
+        return data
+
+    def _sniff(self):
+        self._sniffed = True
+        self.compression = guess_compression(self.name, self._head)
+        data, self._head = self._head, b''
+        return data
+
+    def _decompress(self, data):
+        out = []
+        while data:
+            if self._obj is None:
+                self._obj = DECOMPRESSORS[self.compression]()
+            out.append(self._obj.decompress(data))
+            # Concatenated streams (multi-member gzip files for instance)
+            if self._obj.eof:
+                data = self._obj.unused_data
+                self._obj = None
+            else:
+                data = b''
+        return b''.join(out)
+
+
+def decompress_chunks(chunks, name=None):
+    """Yield the chunks of a stream, decompressed if needed."""
+    decompressor = Decompressor(name)
+    for chunk in chunks:
+        data = decompressor.feed(chunk)
+        if data:
+            yield data
+    data = decompressor.close()
+    if data:
+        yield data
+
+
+@contextmanager
+def open_buffer(path, threshold=MMAP_THRESHOLD):
+    """Open a local file as a read-only buffer.
+
+    Files of `threshold` bytes or more are memory-mapped: their pages are
+    loaded lazily and shared with the page cache, and so with the other
+    processes reading the same file, instead of being copied. Smaller
+    files are read at once. Compressed files are inflated in memory.
+    """
+    with _map_file(path, threshold) as buf:
+        if guess_compression(path, buf[:MAGIC_LENGTH]) is None:
+            yield buf
+        else:
+            yield b''.join(decompress_chunks(iter_chunks(buf), name=path))
+
+
+def open_file(path):
+    """Open a local file for reading, decompressed on the fly if needed."""
+    with open(str(path), 'rb') as f:
+        compression = guess_compression(path, f.read(MAGIC_LENGTH))
+    if compression is None:
+        return open(str(path), 'rb')
+    return OPENERS[compression](str(path))
+
+
+@contextmanager
+def _map_file(path, threshold):
+    with open(str(path), 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < max(threshold, 1):
+            yield f.read()
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buf
+        finally:
+            buf.close()
+
+
+def as_stream(buf):
+    """Return a file-like object reading a buffer."""
+    if isinstance(buf, mmap.mmap):
+        buf.seek(0)
+        return buf
+    return io.BytesIO(buf)
+
+
+def iter_chunks(buf, chunk_size=CHUNK_SIZE):
+    """Yield memoryview slices of a buffer.
+
+    A slice is released once the next one is requested: it must be
+    consumed (or copied) in the meantime. The pages of a memory-mapped
+    file are unmapped once read, so a scan does not grow the RSS.
+    """
+    mapped = isinstance(buf, mmap.mmap) and hasattr(buf, 'madvise') \
+        and chunk_size % mmap.PAGESIZE == 0
+    if mapped:
+        buf.madvise(mmap.MADV_SEQUENTIAL)
+
+    view = memoryview(buf)
+    try:
+        for i in range(0, len(view), chunk_size):
+            chunk = view[i:i + chunk_size]
+            try:
+                yield chunk
+            finally:
+                chunk.release()
+            if mapped:
+                buf.madvise(
+                    mmap.MADV_DONTNEED, i, min(chunk_size, len(view) - i))
+    finally:
+        view.release()
+
+
+def iter_file(path, chunk_size=CHUNK_SIZE):
+    """Yield the chunks of a local file, decompressed on the fly if needed."""
+    with _map_file(path, MMAP_THRESHOLD) as buf:
+        yield from decompress_chunks(iter_chunks(buf, chunk_size), name=path)
+
+
+def split_lines(chunks):
+    """Yield the lines (without the line feed) of a stream read by chunks."""
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + bytes(chunk)).split(b'\n')
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+
+def get_shards(path, count):
+    """Split a file into `count` byte ranges at most, cut at line starts.
+
+    A compressed file cannot be split: its only range is (0, None).
+    """
+    with open(str(path), 'rb') as f:
+        if guess_compression(path, f.read(MAGIC_LENGTH)) is not None:
+            return [(0, None)]
+
+    size = os.path.getsize(str(path))
+    bounds = [0]
+    with open(str(path), 'rb') as f:
+        for i in range(1, count):
+            f.seek(max(size * i // count - 1, bounds[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_lines(path, start=0, end=None):
+    """Yield the lines of a file, or of the lines starting in a byte range."""
+    with open_file(path) as f:
+        if start or end is not None:
+            if not isinstance(f, io.BufferedReader):
+                raise ValueError(
+                    'A compressed file cannot be read by byte ranges.')
+            f.seek(start)
+        if end is None:
+            yield from f
+            return
+        while start < end:
+            line = f.readline()
+            if not line:
+                break
+            start += len(line)
+            yield line
@@ -0,0 +1,114 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from functools import partial
+import hashlib
+from importlib import import_module
+from onegeo_manager.codec import canonical
+
+
+__all__ = ['Fingerprint']
+
+
+ALGORITHMS = ('md5', 'blake2b', 'xxhash')
+
+
+def hash_function(algorithm):
+    """Return the constructor of the hash objects of `algorithm`.
+
+    Digests are 128 bits long (32 hexadecimal characters) whatever the
+    algorithm. 'xxhash' needs the xxhash package.
+    """
+    if algorithm == 'md5':
+        return hashlib.md5
+    if algorithm == 'blake2b':
+        return partial(hashlib.blake2b, digest_size=16)
+    if algorithm == 'xxhash':
+        xxhash = import_module('xxhash')
+        return getattr(xxhash, 'xxh3_128', None) or xxhash.xxh128
+    raise ValueError("Unknown hash algorithm '{0}'.".format(algorithm))
+
+
+class Fingerprint(object):
+    """Settings of the fingerprints of the records.
+
+    Records are hashed through their canonical JSON serialization with
+    `algorithm`. Their properties can be restricted to the names given
+    by `include`, and those given by `exclude` (volatile fields such as
+    modification dates) are left out. If `indexed` is true, only the
+    properties that are indexed (neither rejected nor unknown) and the
+    geometry are hashed.
+
+    The default settings give the digests of `utils.digest_object`.
+    """
+
+    def __init__(self, algorithm='md5', include=None, exclude=None,
+                 indexed=False):
+        self.new = hash_function(algorithm)
+        self.algorithm = algorithm
+        self.include = include is not None and set(include) or None
+        self.exclude = set(exclude or [])
+        self.indexed = indexed
+
+    def compile(self, properties=None, geometry=None, indexed=None):
+        """Return the function hashing the records of a harvest.
+
+        `properties` is the member holding the properties of the records
+        (the records themselves by default), `geometry` the one holding
+        their geometry, and `indexed` the names of the indexed properties.
+        """
+        new = self.new
+        names = self.include
+        if self.indexed and indexed is not None:
+            names = names is None and set(indexed) or names & set(indexed)
+        exclude = self.exclude
+
+        if names is None and not exclude:
+            def digest(record):
+                return new(canonical(record)).hexdigest()
+            return digest
+
+        def select(obj):
+            if names is None:
+                return {k: v for k, v in obj.items() if k not in exclude}
+            return {k: obj[k] for k in names
+                    if k in obj and k not in exclude}
+
+        def digest(record):
+            if properties is None:
+                obj = select(record)
+            elif self.indexed:
+                obj = {properties: select(record[properties])}
+                if geometry is not None:
+                    obj[geometry] = record.get(geometry)
+            else:
+                obj = dict(record)
+                obj[properties] = select(record[properties])
+            return new(canonical(obj)).hexdigest()
+        return digest
+
+    def digest(self, record):
+        """Return the fingerprint of a record given as is."""
+        return self.compile()(record)
+
+    def digest_many(self, records, **kwargs):
+        """Return the fingerprints of `records`.
+
+        This is a shortcut for mapping the function returned by `compile`
+        (see it for the keyword arguments): the settings are compiled once
+        but every record is still serialized and hashed on its own.
+        """
+        return list(map(self.compile(**kwargs), records))
@@ -0,0 +1,240 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import numpy as np
+from onegeo_manager.codec import canonical
+
+
+__all__ = ['GeometryReducer']
+
+
+def _changes(a):
+    """Return the mask of the items of `a` differing from the previous one."""
+    mask = np.empty(len(a), dtype=bool)
+    mask[:1] = True
+    np.not_equal(a[1:], a[:-1], out=mask[1:])
+    return mask
+
+
+def _changes_rows(a):
+    """Return the mask of the rows of `a` that differ from the previous one."""
+    mask = np.empty(len(a), dtype=bool)
+    mask[:1] = True
+    np.not_equal(a[1:], a[:-1]).any(axis=1, out=mask[1:])
+    return mask
+
+
+def simplify(points, tolerance):
+    """Return the mask of the vertices kept by the Douglas-Peucker algorithm.
+
+    All the segments are split at once, so that the number of numpy passes
+    is the depth of the recursion rather than the number of vertices kept.
+    Only the first two dimensions are taken into account.
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    if n < 3:
+        keep[:] = True
+        return keep
+
+    if points.dtype.kind != 'f':
+        points = points.astype(float)
+    x, y = points[:, 0], points[:, 1]
+    tolerance = tolerance * tolerance
+    active = ~keep
+    candidates = np.arange(1, n - 1)
+    while len(candidates):
+        # Bounds of the segment (between two anchors) of every candidate
+        anchors = np.flatnonzero(keep)
+        seg = np.searchsorted(anchors, candidates)
+        start, end = anchors[seg - 1], anchors[seg]
+
+        # Squared distances to the segments, the segments of a closed
+        # ring being possibly reduced to a single point
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[candidates] - x[start], y[candidates] - y[start]
+        length = dx * dx + dy * dy
+        t = np.divide(px * dx + py * dy, length,
+                      out=np.zeros(len(candidates)), where=length > 0)
+        np.clip(t, 0, 1, out=t)
+        px -= t * dx
+        py -= t * dy
+        dist = px * px + py * py
+
+        # Candidates are sorted, so each segment is a run of them
+        first = _changes(seg)
+        run = np.cumsum(first) - 1
+        dmax = np.maximum.reduceat(dist, np.flatnonzero(first))
+        split = (dmax > tolerance)[run]
+
+        # The (first) farthest vertex of each segment to split becomes an
+        # anchor, the vertices of the other segments are dropped
+        farthest = np.flatnonzero(split & (dist == dmax[run]))
+        farthest = candidates[farthest[_changes(run[farthest])]]
+        keep[farthest] = True
+        active[candidates[~split]] = False
+        active[farthest] = False
+        candidates = np.flatnonzero(active)
+    return keep
+
+
+def _signed_area(xy):
+    x, y = xy[:, 0], xy[:, 1]
+    return (np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2
+
+
+class GeometryReducer(object):
+    """Reduce the size of GeoJSON geometries before indexing.
+
+    Coordinates are rounded to `precision` decimals, consecutive duplicate
+    vertices are dropped, then lines and rings are simplified with the
+    Douglas-Peucker algorithm if a `tolerance` (in coordinate units) is
+    given.
+
+    Rings are kept closed. A ring that would collapse (less than four
+    vertices, zero area or reversed orientation) is kept as it is.
+    Simplification does not check that rings do not intersect each other.
+
+    Positions are copied as they are when they are not rounded. A reduced
+    geometry is never larger than the original one, which is kept
+    otherwise.
+
+    The size of the serialized geometries is measured by `process`:
+    `records`, `size` and `saved` sum up the geometries processed.
+    """
+
+    def __init__(self, precision=None, tolerance=None):
+        if precision is not None and not type(precision) is int:
+            raise TypeError('Precision should be an integer.')
+        if tolerance is not None and not type(tolerance) in [float, int]:
+            raise TypeError('Tolerance should be a float or int.')
+        self.precision = precision
+        self.tolerance = tolerance or None
+
+        self.records = 0
+        self.size = 0
+        self.saved = 0
+
+    def process(self, geometry):
+        """Return the reduced geometry and its byte savings.
+
+        The savings are given as {'size': <bytes before>, 'saved': <bytes
+        saved>}, the sizes being the ones of the compact JSON texts.
+        """
+        if not geometry:
+            return geometry, {'size': 0, 'saved': 0}
+        size = len(canonical(geometry))
+        reduced = self.reduce(geometry)
+        saved = size - len(canonical(reduced))
+        if saved < 0:
+            # Never grow a geometry (integers mixed with floats are all
+            # written as floats for instance)
+            reduced, saved = geometry, 0
+
+        self.records += 1
+        self.size += size
+        self.saved += saved
+        return reduced, {'size': size, 'saved': saved}
+
+    def reduce(self, geometry):
+        kind = geometry.get('type')
+        coordinates = geometry.get('coordinates')
+        if kind == 'GeometryCollection':
+            coordinates = None
+            geometries = [self.reduce(g) for g in geometry['geometries']]
+        elif kind == 'Point':
+            coordinates = self._round(coordinates)
+        elif kind == 'MultiPoint':
+            coordinates = [self._round(p) for p in coordinates]
+        elif kind == 'LineString':
+            coordinates = self._reduce_line(coordinates)
+        elif kind == 'MultiLineString':
+            coordinates = [self._reduce_line(line) for line in coordinates]
+        elif kind == 'Polygon':
+            coordinates = self._reduce_polygon(coordinates)
+        elif kind == 'MultiPolygon':
+            coordinates = [self._reduce_polygon(p) for p in coordinates]
+        else:
+            return geometry
+
+        reduced = dict(geometry)
+        if coordinates is None:
+            reduced['geometries'] = geometries
+        else:
+            reduced['coordinates'] = coordinates
+        return reduced
+
+    def _round(self, position):
+        if self.precision is None or not position:
+            return position
+        return [round(c, self.precision) for c in position]
+
+    def _as_array(self, positions):
+        try:
+            # Integer coordinates stay integers
+            a = np.array(positions)
+        except (TypeError, ValueError):
+            # Positions of different dimensions
+            return None
+        if a.dtype.kind not in 'iuf' or a.ndim != 2 or a.shape[1] < 2:
+            return None
+        if self.precision is not None:
+            a = np.round(a, self.precision)
+        return a
+
+    @staticmethod
+    def _dedupe(a):
+        """Return the indices of the positions distinct from the previous."""
+        return np.flatnonzero(_changes_rows(a))
+
+    def _select(self, positions, a, index):
+        # Positions are copied as they are unless they have been rounded,
+        # so that integers mixed with floats stay integers
+        if self.precision is None:
+            return [positions[i] for i in index.tolist()]
+        return a[index].tolist()
+
+    def _reduce_line(self, positions):
+        a = self._as_array(positions)
+        if a is None:
+            return positions
+        index = self._dedupe(a)
+        if len(index) < 2:
+            # A line reduced to a single position is kept as it is
+            return positions
+        if self.tolerance:
+            index = index[simplify(a[index], self.tolerance)]
+        return self._select(positions, a, index)
+
+    def _reduce_ring(self, positions):
+        a = self._as_array(positions)
+        if a is None:
+            return positions
+        index = self._dedupe(a)
+        if self.tolerance and len(index) > 4:
+            index = index[simplify(a[index], self.tolerance)]
+        if not np.array_equal(a[index[0]], a[index[-1]]):
+            index = np.append(index, index[0])
+        if len(index) < 4:
+            return positions
+        area, rounded = _signed_area(a[index]), _signed_area(a)
+        if area == 0 or rounded == 0 or (area > 0) != (rounded > 0):
+            return positions
+        return self._select(positions, a, index)
+
+    def _reduce_polygon(self, rings):
+        return [self._reduce_ring(ring) for ring in rings]
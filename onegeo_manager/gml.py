@@ -0,0 +1,273 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from onegeo_manager.exception import OGCDocumentError
+from onegeo_manager.exception import OGCExceptionReport
+import re
+from xml.etree.ElementTree import iterparse
+
+
+GML_NS = ('http://www.opengis.net/gml', 'http://www.opengis.net/gml/3.2')
+
+MEMBER = ('member', 'featureMember', 'featureMembers')
+
+# CRS whose authority axis order is latitude/longitude
+LATLON_CRS = re.compile(
+    r'^(urn:ogc:def:crs:EPSG:[\d.]*:|'
+    r'https?://www.opengis.net/def/crs/EPSG/0/)(4326|4258|4171)$')
+
+
+def split_tag(tag):
+    if tag.startswith('{'):
+        ns, name = tag[1:].split('}', 1)
+        return ns, name
+    return None, tag
+
+
+def local_name(tag):
+    return split_tag(tag)[1]
+
+
+def is_gml(elt):
+    return split_tag(elt.tag)[0] in GML_NS
+
+
+def find_gml(elt, *names):
+    for child in elt:
+        if is_gml(child) and local_name(child.tag) in names:
+            return child
+
+
+def iter_gml(elt, *names):
+    for child in elt:
+        if is_gml(child) and local_name(child.tag) in names:
+            yield child
+
+
+def get_attr(elt, name):
+    for k, v in elt.attrib.items():
+        if local_name(k) == name:
+            return v
+
+
+class GeometryReader(object):
+
+    def __init__(self, srs_name=None):
+        self.srs_name = srs_name
+
+    def swap_axes(self, elt):
+        srs_name = elt.get('srsName') or self.srs_name
+        return bool(srs_name and LATLON_CRS.match(srs_name))
+
+    def positions(self, elt, swap, dimension=2):
+        """Return the list of positions held by a geometry element."""
+        pos_list = find_gml(elt, 'posList')
+        if pos_list is not None:
+            dimension = int(pos_list.get('srsDimension') or dimension)
+            values = [float(v) for v in (pos_list.text or '').split()]
+            coords = [values[i:i + dimension]
+                      for i in range(0, len(values), dimension)]
+        else:
+            coords = [[float(v) for v in (p.text or '').split()]
+                      for p in iter_gml(elt, 'pos')]
+            coordinates = find_gml(elt, 'coordinates')
+            if coordinates is not None:  # GML 2
+                cs = coordinates.get('cs', ',')
+                ts = coordinates.get('ts', ' ')
+                dec = coordinates.get('decimal', '.')
+                coords = [
+                    [float(v.replace(dec, '.')) for v in tup.split(cs)]
+                    for tup in (coordinates.text or '').strip().split(ts)
+                    if tup]
+            for coord in iter_gml(elt, 'coord'):  # GML 2
+                coords.append([
+                    float(c.text) for c in coord if c.text is not None])
+        if swap:
+            coords = [[c[1], c[0]] + c[2:] for c in coords]
+        return coords
+
+    def ring(self, elt, swap):
+        ring = find_gml(elt, 'LinearRing', 'Ring')
+        if ring is None:
+            raise OGCDocumentError('Unexpected GML ring element.')
+        if local_name(ring.tag) == 'Ring':
+            coords = []
+            for member in iter_gml(ring, 'curveMember'):
+                for curve in member:
+                    coords.extend(self.line(curve, swap))
+            return coords
+        return self.positions(ring, swap)
+
+    def line(self, elt, swap):
+        name = local_name(elt.tag)
+        if name == 'Curve':
+            coords = []
+            segments = find_gml(elt, 'segments')
+            for segment in segments if segments is not None else []:
+                part = self.positions(segment, swap)
+                if coords and part and coords[-1] == part[0]:
+                    part = part[1:]
+                coords.extend(part)
+            return coords
+        return self.positions(elt, swap)
+
+    def polygon(self, elt, swap):
+        if local_name(elt.tag) == 'Surface':
+            patches = find_gml(elt, 'patches')
+            patch = patches is not None and find_gml(
+                patches, 'PolygonPatch', 'Rectangle') or None
+            if patch is None:
+                raise OGCDocumentError('Unexpected GML surface element.')
+            elt = patch
+        rings = []
+        for boundary in iter_gml(
+                elt, 'exterior', 'outerBoundaryIs', 'interior',
+                'innerBoundaryIs'):
+            rings.append(self.ring(boundary, swap))
+        return rings
+
+    def members(self, elt, *names):
+        for member in iter_gml(elt, *names):
+            yield from member
+        for members in iter_gml(elt, *(n + 's' for n in names)):
+            yield from members
+
+    def read(self, elt):
+        """Convert a GML geometry element to a GeoJSON geometry."""
+        name = local_name(elt.tag)
+        swap = self.swap_axes(elt)
+        if elt.get('srsName'):
+            reader = GeometryReader(srs_name=elt.get('srsName'))
+        else:
+            reader = self
+
+        if name == 'Point':
+            coords = reader.positions(elt, swap)
+            return {'type': 'Point', 'coordinates': coords and coords[0]}
+
+        if name in ('LineString', 'Curve'):
+            return {'type': 'LineString',
+                    'coordinates': reader.line(elt, swap)}
+
+        if name in ('Polygon', 'Surface'):
+            return {'type': 'Polygon',
+                    'coordinates': reader.polygon(elt, swap)}
+
+        if name == 'MultiPoint':
+            return {'type': 'MultiPoint', 'coordinates': [
+                reader.positions(m, reader.swap_axes(m))[0]
+                for m in reader.members(elt, 'pointMember')]}
+
+        if name in ('MultiLineString', 'MultiCurve'):
+            return {'type': 'MultiLineString', 'coordinates': [
+                reader.line(m, reader.swap_axes(m))
+                for m in reader.members(
+                    elt, 'lineStringMember', 'curveMember')]}
+
+        if name in ('MultiPolygon', 'MultiSurface'):
+            return {'type': 'MultiPolygon', 'coordinates': [
+                reader.polygon(m, reader.swap_axes(m))
+                for m in reader.members(
+                    elt, 'polygonMember', 'surfaceMember')]}
+
+        if name in ('MultiGeometry', 'MultiGeometryCollection'):
+            return {'type': 'GeometryCollection', 'geometries': [
+                reader.read(m)
+                for m in reader.members(elt, 'geometryMember')]}
+
+        raise OGCDocumentError(
+            "GML geometry '{0}' is not supported.".format(name))
+
+
+def read_value(elt):
+    if len(elt) == 0:
+        return elt.text
+    value = {}
+    for child in elt:
+        value[local_name(child.tag)] = read_value(child)
+    return value
+
+
+def read_feature(elt, reader):
+    """Convert a GML feature element to a GeoJSON-like feature."""
+    feature = {
+        'type': 'Feature',
+        'id': get_attr(elt, 'id') or elt.get('fid'),
+        'geometry': None,
+        'properties': {}}
+
+    for prop in elt:
+        name = local_name(prop.tag)
+        if is_gml(prop) and name in ('boundedBy', 'name', 'description'):
+            continue
+        if len(prop) == 1 and is_gml(prop[0]):
+            geometry = reader.read(prop[0])
+            if feature['geometry'] is None:
+                feature['geometry'] = geometry
+                continue
+            feature['properties'][name] = geometry
+            continue
+        feature['properties'][name] = read_value(prop)
+    return feature
+
+
+def raise_exception_report(root):
+    exception = None
+    for elt in root.iter():
+        if local_name(elt.tag) == 'Exception':
+            exception = elt
+            break
+    if exception is None:
+        raise OGCExceptionReport(None, None)
+    text = None
+    for elt in exception.iter():
+        if local_name(elt.tag) == 'ExceptionText':
+            text = elt.text
+            break
+    raise OGCExceptionReport(exception.get('exceptionCode'), text)
+
+
+def iter_features(stream, srs_name=None):
+    """Yield GeoJSON-like features read from a GML feature collection.
+
+    `wfs:member` / `gml:featureMember` elements are parsed one at a time
+    and dropped from the tree once converted, so the memory used is
+    bounded by the size of the largest single feature.
+    """
+    reader = GeometryReader(srs_name=srs_name)
+
+    root = None
+    depth = 0
+    for event, elt in iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = elt
+            continue
+
+        depth -= 1
+        if depth == 0:
+            if local_name(elt.tag) == 'ExceptionReport':
+                raise_exception_report(elt)
+            break
+
+        if depth == 1 and local_name(elt.tag) in MEMBER:
+            for child in elt:
+                if local_name(child.tag) == 'FeatureCollection':
+                    # WFS 2.0 may nest collections (joins, additionalObjects)
+                    continue
+                yield read_feature(child, reader)
+            root.clear()
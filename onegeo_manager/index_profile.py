@@ -17,11 +17,20 @@
 from abc import ABCMeta
 from abc import abstractmethod
 from importlib import import_module
+from onegeo_manager.bulk import Batch
+from onegeo_manager.bulk import batch_collection
+from onegeo_manager.bulk import BULK_MAX_BYTES
+from onegeo_manager.bulk import BULK_MAX_DOCS
+from onegeo_manager.bulk import BulkEncoder
 from onegeo_manager.exception import ProtocolNotFoundError
+from onegeo_manager.fingerprint import Fingerprint
+from onegeo_manager.geometry import GeometryReducer
+import math
 import re
 
 
-__all__ = ['IndexProfile', 'PropertyColumn']
+__all__ = [
+    'IndexProfile', 'Projection', 'PropertyColumn', 'RecordTransformer']
 
 
 not_searchable = lambda val: {
@@ -141,6 +150,22 @@ def fetch_mapping(p):
                 'points_only': False}
 
 
+def format_collection(fun, collection, by_page=False):
+    """Apply `fun` to every record of a (possibly asynchronous) collection.
+
+    If `by_page` is true, the items of the collection are lists of records.
+    """
+    if by_page:
+        return format_collection(
+            lambda page: [fun(record) for record in page], collection)
+    if hasattr(collection, '__aiter__'):
+        async def wrapper():
+            async for record in collection:
+                yield fun(record)
+        return wrapper()
+    return (fun(record) for record in collection)
+
+
 class PropertyColumn(object):
 
     COLUMN_TYPE = ['binary', 'boolean', 'byte', 'date', 'date_range',
@@ -299,8 +324,144 @@ class PropertyColumn(object):
                 'suggest': self._suggest}
 
 
+class Projection(object):
+    """Compiled mapping of the source keys to the members of a document.
+
+    Each key is either kept (under the alias of its property), backed up
+    (rejected properties) or dropped (unknown keys), with a single lookup
+    per key of the record.
+    """
+
+    def __init__(self, properties, ignore=[]):
+        self.keep = {}
+        self.backup = set()
+        for p in properties:
+            if p.name in ignore or p.name in self.keep \
+                    or p.name in self.backup:
+                continue
+            if p.rejected:
+                self.backup.add(p.name)
+            else:
+                self.keep[p.name] = p.alias or p.name
+
+    def __call__(self, record):
+        """Return the kept and the backed up members of a record."""
+        keep, backup = self.keep, self.backup
+        properties, _backuped = {}, {}
+        for k, v in record.items():
+            alias = keep.get(k)
+            if alias is not None:
+                properties[alias] = v
+            elif k in backup:
+                _backuped[k] = v
+        return properties, _backuped
+
+
+def _as_boolean(value):
+    value = value.strip().lower()
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise ValueError(value)
+
+
+def _as_double(value):
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(value)
+    return value
+
+
+COERCERS = {
+    'boolean': _as_boolean,
+    'byte': int,
+    'double': _as_double,
+    'float': _as_double,
+    'half_float': _as_double,
+    'integer': int,
+    'long': int,
+    'scaled_float': _as_double,
+    'short': int}
+
+
+def compile_coercers(properties):
+    """Map the members of the documents to the parsers of their type.
+
+    Only string values are parsed (text values of a GML document for
+    instance): they are kept as they are if they cannot be.
+    """
+    coercers = {}
+    for p in properties:
+        if not p.rejected and p.column_type in COERCERS:
+            coercers.setdefault(p.alias or p.name, COERCERS[p.column_type])
+    return coercers
+
+
+class RecordTransformer(object):
+    """Compiled transformation of the records of a harvest into documents.
+
+    `projection` splits the properties of a record, read from its
+    `properties` member or the record itself, into the kept and the backed
+    up members. The `lineage` sub-document is built once and shared by all
+    the documents: it must not be modified.
+
+    The other stages are optional: `digest` hashes the record into '_md5',
+    `coercers` parses the string values of typed properties, and the
+    `geometry` member of the record is copied into the document, reduced
+    by `reducer` if any.
+    """
+
+    def __init__(self, projection, properties=None, lineage=None,
+                 digest=None, coercers=None, geometry=None, reducer=None):
+        self.projection = projection
+        self.properties = properties
+        self.lineage = lineage
+        self.digest = digest
+        self.coercers = coercers
+        self.geometry = geometry
+        self.reducer = reducer
+
+    def __call__(self, record):
+        properties, _backuped = self.projection(
+            record if self.properties is None else record[self.properties])
+        if self.coercers:
+            self._coerce(properties)
+
+        document = {
+            '_backup': _backuped,
+            '_md5': self.digest and self.digest(record) or None,
+            'lineage': self.lineage,
+            'properties': properties}
+
+        if self.geometry is not None:
+            geometry = record.get(self.geometry) or None
+            if self.reducer is None:
+                document['geometry'] = geometry
+            else:
+                document['geometry'], document['_geometry'] = \
+                    self.reducer.process(geometry)
+        return document
+
+    def _coerce(self, properties):
+        for k, parse in self.coercers.items():
+            value = properties.get(k)
+            try:
+                if type(value) is str:
+                    properties[k] = parse(value)
+                elif type(value) is list:
+                    properties[k] = [
+                        parse(v) if type(v) is str else v for v in value]
+            except ValueError:
+                pass
+
+
 class AbstractIndexProfile(metaclass=ABCMeta):
 
+    # Whether `get_collection` accepts `by_page` and then yields lists of
+    # documents (one per page of the server)
+    PAGED_COLLECTION = False
+
     def __init__(self, name, resource):
 
         self._name = name
@@ -310,12 +471,17 @@ class AbstractIndexProfile(metaclass=ABCMeta):
         self._resource = resource
 
         self._properties = []
+        self._index = {}
         for c in self.resource.iter_columns():
-            self._properties.append(PropertyColumn(
+            self._add_property(PropertyColumn(
                 c.get('name'), column_type=c.get('type'), count=c.get('count'),
                 occurs=c.get('occurs'), rule=c.get('rule')))
 
         self._tags = []
+        self._hashing = True
+        self._coerce_types = False
+        self._fingerprint = None
+        self._geometry_reducer = None
 
     @property
     def name(self):
@@ -337,38 +503,45 @@ class AbstractIndexProfile(metaclass=ABCMeta):
         if not p.__class__.__qualname__ == 'PropertyColumn':
             raise TypeError(
                 "Argument should be an instance of 'PropertyColumn'.")
+        self._add_property(p)
+
+    def _add_property(self, p):
         self._properties.append(p)
+        # The first property of a name wins, as with a linear lookup
+        self._index.setdefault(p.name, p)
 
     def get_property(self, name):
-        for p in self.iter_properties():
-            if p.name == name:
-                return p
+        return self._index.get(name)
+
+    def compile_projection(self, ignore=[]):
+        """Compile the projection of the records, once per harvest."""
+        return Projection(self._properties, ignore=ignore)
 
     def update_property(self, name, param, value):
-        for p in self.iter_properties():
-            if p.name == name:
-                if param == 'alias':
-                    p.alias = value
-                if param in ('column_type', 'type'):
-                    p.column_type = value
-                if param == 'occurs':
-                    p.occurs = value
-                if param == 'rejected':
-                    p.rejected = value
-                if param == 'searchable':
-                    p.searchable = value
-                if param == 'weight':
-                    p.weight = value
-                if param == 'pattern':
-                    p.pattern = value
-                if param == 'rule':
-                    p.rule = value
-                if param == 'analyzer':
-                    p.analyzer = value
-                if param == 'search_analyzer':
-                    p.search_analyzer = value
-                if param == 'suggest':
-                    p.suggest = value
+        p = self.get_property(name)
+        if p:
+            if param == 'alias':
+                p.alias = value
+            if param in ('column_type', 'type'):
+                p.column_type = value
+            if param == 'occurs':
+                p.occurs = value
+            if param == 'rejected':
+                p.rejected = value
+            if param == 'searchable':
+                p.searchable = value
+            if param == 'weight':
+                p.weight = value
+            if param == 'pattern':
+                p.pattern = value
+            if param == 'rule':
+                p.rule = value
+            if param == 'analyzer':
+                p.analyzer = value
+            if param == 'search_analyzer':
+                p.search_analyzer = value
+            if param == 'suggest':
+                p.suggest = value
 
     @property
     def tags(self):
@@ -383,6 +556,68 @@ class AbstractIndexProfile(metaclass=ABCMeta):
     def iter_tags(self):
         return iter(self._tags)
 
+    @property
+    def geometry_reducer(self):
+        return self._geometry_reducer
+
+    @geometry_reducer.setter
+    def geometry_reducer(self, val):
+        if val is not None and not isinstance(val, GeometryReducer):
+            raise TypeError(
+                "Input should be an instance of 'GeometryReducer'.")
+        self._geometry_reducer = val
+
+    @property
+    def hashing(self):
+        return self._hashing
+
+    @hashing.setter
+    def hashing(self, val):
+        if not type(val) is bool:
+            raise TypeError('Input should be a boolean.')
+        self._hashing = val
+
+    @property
+    def coerce_types(self):
+        return self._coerce_types
+
+    @coerce_types.setter
+    def coerce_types(self, val):
+        if not type(val) is bool:
+            raise TypeError('Input should be a boolean.')
+        self._coerce_types = val
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    @fingerprint.setter
+    def fingerprint(self, val):
+        if val is not None and not isinstance(val, Fingerprint):
+            raise TypeError("Input should be an instance of 'Fingerprint'.")
+        self._fingerprint = val
+
+    def compile_transformer(self, digest=None, fingerprint=True, **kwargs):
+        """Compile the transformation of the records, once per harvest.
+
+        The optional stages are switched on by the settings of the profile:
+        `hashing` (with the `fingerprint` settings if any, else the given
+        `digest` function), `coerce_types` and `geometry_reducer`. If
+        `fingerprint` is false, `digest` is used whatever the settings.
+        See `RecordTransformer` for the other arguments.
+        """
+        projection = self.compile_projection(ignore=kwargs.pop('ignore', []))
+        if digest is not None and fingerprint \
+                and self._fingerprint is not None:
+            digest = self._fingerprint.compile(
+                properties=kwargs.get('properties'),
+                geometry=kwargs.get('geometry'), indexed=projection.keep)
+        return RecordTransformer(
+            projection, digest=self._hashing and digest or None,
+            coercers=self._coerce_types and compile_coercers(
+                self._properties) or None,
+            reducer=self._geometry_reducer, **kwargs)
+
     @abstractmethod
     def generate_elastic_mapping(self):
         raise NotImplementedError(
@@ -393,6 +628,40 @@ class AbstractIndexProfile(metaclass=ABCMeta):
         raise NotImplementedError(
             "This is an abstract method. You can't do anything with it.")
 
+    def get_collection_batches(self, max_docs=BULK_MAX_DOCS,
+                               max_bytes=BULK_MAX_BYTES, encoder=None,
+                               **opts):
+        """Yield the documents of `get_collection(**opts)` by batches.
+
+        Batches are lists of documents holding `max_docs` documents and
+        `max_bytes` bytes of bulk request lines at most, as encoded by
+        `encoder` (see `get_bulk_encoder`), and keep the encoded lines, see
+        `bulk.Batcher`. The pages of paged collections are kept whole, and
+        committed to their `checkpoint` once their batch has been consumed.
+        """
+        if self.PAGED_COLLECTION:
+            opts['by_page'] = True
+        return batch_collection(
+            self.get_collection(**opts), encoder or self.get_bulk_encoder(),
+            max_docs=max_docs, max_bytes=max_bytes,
+            pages=self.PAGED_COLLECTION, checkpoint=opts.get('checkpoint'))
+
+    def get_bulk_encoder(self, **kwargs):
+        """Return a `bulk.BulkEncoder` indexing the documents into the index
+        and type of `generate_elastic_mapping`."""
+        return BulkEncoder(self.name, doc_type=self.name, **kwargs)
+
+    def get_bulk_requests(self, encoder=None, **opts):
+        """Yield the bodies of the bulk requests indexing the collection.
+
+        The lines of the documents are encoded once, when the collection
+        is batched, by `encoder` (`get_bulk_encoder()` by default).
+        """
+        encoder = encoder or self.get_bulk_encoder()
+        return format_collection(Batch.body, self.get_collection_batches(
+            max_docs=encoder.max_docs, max_bytes=encoder.max_bytes,
+            encoder=encoder, **opts))
+
 
 class IndexProfile(object):
 
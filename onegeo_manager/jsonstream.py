@@ -0,0 +1,335 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import codecs
+import json
+import re
+
+
+NUMBER_TAIL = re.compile('[-+.0-9eE]*')
+
+WHITESPACE = re.compile('[ \t\n\r]*')
+
+# Reader states
+START, KEY_OR_END, KEY, COLON, VALUE, MEMBER_SEP, \
+    ITEM_OR_END, ITEM, ITEM_SEP, END = range(10)
+
+
+class StreamReader(object):
+    """Base class of the incremental readers of a JSON document.
+
+    Data is fed by chunks (binary chunks are decoded as UTF-8) to a state
+    machine implemented by `_step`, which appends to `items` what is
+    returned to the caller.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._scanner = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._need = 0
+        self._state = START
+        self._closed = False
+
+    def feed(self, data):
+        """Return the list of the items completed by `data`."""
+        if not isinstance(data, str):
+            data = self._decoder.decode(data)
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        items = []
+        if len(self._buf) >= self._need:
+            while self._step(items):
+                pass
+        return items
+
+    def close(self):
+        """Return the last items and check the document is complete."""
+        items = self.feed(self._decoder.decode(b'', final=True))
+        self._closed = True
+        self._need = 0
+        while self._step(items):
+            pass
+        if self._state != END:
+            raise json.JSONDecodeError(
+                'Unexpected end of JSON document', self._buf, self._pos)
+        return items
+
+    def _error(self, msg):
+        raise json.JSONDecodeError(msg, self._buf, self._pos)
+
+    def _decode(self):
+        """Decode the next value, or return False if more data is needed."""
+        try:
+            value, end = self._scanner.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._closed:
+                raise
+            # Wait for the buffer to double so that a large value is
+            # not parsed again on every chunk
+            self._need = 2 * (len(self._buf) - self._pos)
+            return False
+        if not self._closed and (
+                isinstance(value, (int, float)) and not isinstance(value, bool)
+                and NUMBER_TAIL.match(self._buf, end).end() == len(self._buf)):
+            # The number may be cut at the end of the chunk
+            self._need = len(self._buf) - self._pos + 1
+            return False
+        self._need = 0
+        self._pos = end
+        return value,
+
+    def _step(self, items):
+        raise NotImplementedError
+
+
+class ArrayReader(StreamReader):
+    """Incremental reader of an array member of a top-level JSON object.
+
+    Every item of the array `key` is returned as soon as it is complete,
+    so the memory used is bounded by the size of the largest item. The
+    other members of the object are kept in `members`.
+    """
+
+    def __init__(self, key):
+        super().__init__()
+        self.key = key
+        self.members = {}
+        self.found = False
+        self._name = None
+
+    def _step(self, items):
+        self._pos = WHITESPACE.match(self._buf, self._pos).end()
+        if self._pos == len(self._buf):
+            return False
+        char = self._buf[self._pos]
+        state = self._state
+
+        if state == START:
+            if char != '{':
+                self._error("Expecting '{'")
+            self._pos += 1
+            self._state = KEY_OR_END
+
+        elif state in (KEY_OR_END, KEY):
+            if char == '}' and state == KEY_OR_END:
+                self._pos += 1
+                self._state = END
+                return True
+            if char != '"':
+                self._error(
+                    'Expecting property name enclosed in double quotes')
+            decoded = self._decode()
+            if not decoded:
+                return False
+            self._name = decoded[0]
+            self._state = COLON
+
+        elif state == COLON:
+            if char != ':':
+                self._error("Expecting ':' delimiter")
+            self._pos += 1
+            self._state = VALUE
+
+        elif state == VALUE:
+            if self._name == self.key and char == '[':
+                self.found = True
+                self._pos += 1
+                self._state = ITEM_OR_END
+                return True
+            decoded = self._decode()
+            if not decoded:
+                return False
+            self.members[self._name] = decoded[0]
+            self._state = MEMBER_SEP
+
+        elif state == MEMBER_SEP:
+            if char not in ',}':
+                self._error("Expecting ',' delimiter")
+            self._pos += 1
+            self._state = char == ',' and KEY or END
+
+        elif state in (ITEM_OR_END, ITEM):
+            if char == ']' and state == ITEM_OR_END:
+                self._pos += 1
+                self._state = MEMBER_SEP
+                return True
+            decoded = self._decode()
+            if not decoded:
+                return False
+            items.append(decoded[0])
+            self._state = ITEM_SEP
+
+        elif state == ITEM_SEP:
+            if char not in ',]':
+                self._error("Expecting ',' delimiter")
+            self._pos += 1
+            self._state = char == ',' and ITEM or MEMBER_SEP
+
+        else:
+            self._error('Extra data')
+
+        return True
+
+
+class RecordReader(StreamReader):
+    """Incremental reader of the records of any JSON document.
+
+    A record is an object item of an array, at any depth. Every record is
+    returned as soon as it is complete, with the path of its array (the
+    names of the enclosing members, array indexes left out), so the memory
+    used is bounded by the size of the largest record. The other values
+    are read and dropped.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Open containers, as [char, name of the current member]
+        self._stack = []
+        self._path = ()
+        self._state = VALUE
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = tuple(
+                name for char, name in self._stack if char == '{')
+        return self._path
+
+    def _end_value(self):
+        if not self._stack:
+            self._state = END
+        else:
+            self._state = self._stack[-1][0] == '{' and MEMBER_SEP or ITEM_SEP
+
+    def _step(self, items):
+        self._pos = WHITESPACE.match(self._buf, self._pos).end()
+        if self._pos == len(self._buf):
+            return False
+        char = self._buf[self._pos]
+        state = self._state
+
+        if state in (VALUE, ITEM, ITEM_OR_END):
+            if char == ']' and state == ITEM_OR_END:
+                self._pos += 1
+                self._stack.pop()
+                self._path = None
+                self._end_value()
+                return True
+            in_array = bool(self._stack) and self._stack[-1][0] == '['
+            if char in '{[' and not (char == '{' and in_array):
+                self._pos += 1
+                self._stack.append([char, None])
+                self._path = None
+                self._state = char == '{' and KEY_OR_END or ITEM_OR_END
+                return True
+            decoded = self._decode()
+            if not decoded:
+                return False
+            self._end_value()
+            if char == '{':
+                items.append((self.path, decoded[0]))
+                self._read_records(items)
+
+        elif state in (KEY_OR_END, KEY):
+            if char == '}' and state == KEY_OR_END:
+                self._pos += 1
+                self._stack.pop()
+                self._path = None
+                self._end_value()
+                return True
+            if char != '"':
+                self._error(
+                    'Expecting property name enclosed in double quotes')
+            decoded = self._decode()
+            if not decoded:
+                return False
+            self._stack[-1][1] = decoded[0]
+            self._path = None
+            self._state = COLON
+
+        elif state == COLON:
+            if char != ':':
+                self._error("Expecting ':' delimiter")
+            self._pos += 1
+            self._state = VALUE
+
+        elif state in (MEMBER_SEP, ITEM_SEP):
+            close = state == MEMBER_SEP and '}' or ']'
+            if char not in ',' + close:
+                self._error("Expecting ',' delimiter")
+            self._pos += 1
+            if char == ',':
+                self._state = state == MEMBER_SEP and KEY or ITEM
+            else:
+                self._stack.pop()
+                self._path = None
+                self._end_value()
+
+        else:
+            self._error('Extra data')
+
+        return True
+
+    def _read_records(self, items):
+        """Read at once the next records of the current array."""
+        buf, pos, path = self._buf, self._pos, self.path
+        while True:
+            sep = WHITESPACE.match(buf, pos).end()
+            if not buf.startswith(',', sep):
+                break
+            start = WHITESPACE.match(buf, sep + 1).end()
+            if not buf.startswith('{', start):
+                break
+            try:
+                value, pos = self._scanner.raw_decode(buf, start)
+            except json.JSONDecodeError:
+                break
+            items.append((path, value))
+        self._pos = pos
+
+
+def walk_records(obj):
+    """Yield the records of a decoded JSON document as `RecordReader` does."""
+    stack = [((), obj, False)]
+    while stack:
+        path, obj, record = stack.pop()
+        if record:
+            yield path, obj
+        elif isinstance(obj, dict):
+            stack.extend(
+                (path + (k,), v, False)
+                for k, v in reversed(list(obj.items())))
+        elif isinstance(obj, list):
+            stack.extend(
+                (path, item, isinstance(item, dict)) for item in reversed(obj))
+
+
+def iter_array(chunks, key, reader=None):
+    """Yield the items of the array `key` of a JSON object read by chunks."""
+    reader = reader or ArrayReader(key)
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+    yield from reader.close()
+
+
+def iter_records(chunks, reader=None):
+    """Yield the records of a JSON document read by chunks with their path."""
+    reader = reader or RecordReader()
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+    yield from reader.close()
@@ -0,0 +1,198 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from collections import Counter
+from collections import OrderedDict
+import random
+import re
+
+
+DATE = re.compile(
+    r'^\d{4}-\d{2}-\d{2}(T\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$')
+
+INT_MAX = 2 ** 31 - 1
+
+KEYWORD_MAX_LENGTH = 256
+
+
+def value_kind(value):
+    kind = type(value)
+    if kind is str:
+        if DATE.match(value):
+            return 'date'
+        if len(value) > KEYWORD_MAX_LENGTH or len(value.split()) > 1:
+            return 'text'
+        return 'keyword'
+    if kind is int:
+        return -INT_MAX - 1 <= value <= INT_MAX and 'integer' or 'long'
+    if kind is float:
+        return 'float'
+    if kind is bool:
+        return 'boolean'
+    return 'object'
+
+
+class ColumnProfile(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.max_occurs = 1
+        self.kinds = set()
+
+    def update(self, value):
+        if type(value) is not list:
+            self.count += 1
+            self.kinds.add(value_kind(value))
+            return
+        values = [v for v in value if v is not None]
+        if values:
+            self.count += 1
+            self.max_occurs = max(self.max_occurs, len(values))
+        for v in values:
+            self.kinds.add(value_kind(v))
+
+    @property
+    def column_type(self):
+        """Return the narrowest type that holds every value seen."""
+        kinds = self.kinds
+        if not kinds or 'object' in kinds:
+            return None
+        for column_type, allowed in (
+                ('boolean', {'boolean'}),
+                ('integer', {'integer'}),
+                ('long', {'integer', 'long'}),
+                ('double', {'integer', 'long', 'float'}),
+                ('date', {'date'})):
+            if kinds <= allowed:
+                return column_type
+        return 'text' in kinds and 'text' or 'keyword'
+
+
+class RecordProfiler(object):
+    """Infer the columns of a collection of records in a single pass.
+
+    Records are fed one at a time. Every record is profiled unless
+    `sample` is given: a reservoir sample of `sample` records is then
+    kept and profiled once the collection is closed, so that memory does
+    not depend on the size of the collection either way.
+
+    Column types are 'boolean', 'integer' (or 'long'), 'double', 'date'
+    (ISO 8601 strings), 'keyword' (single tokens) or 'text'. Objects are
+    left untyped.
+    """
+
+    def __init__(self, sample=None):
+        self.sample = sample
+        self.seen = 0
+        self.total = 0
+        self.columns = OrderedDict()
+        self._reservoir = []
+
+    def feed(self, record):
+        self.seen += 1
+        if not self.sample:
+            self.update(record)
+        elif len(self._reservoir) < self.sample:
+            self._reservoir.append(record)
+        else:
+            i = random.randrange(self.seen)
+            if i < self.sample:
+                self._reservoir[i] = record
+
+    def close(self):
+        for record in self._reservoir:
+            self.update(record)
+        self._reservoir = []
+        return self
+
+    def profile(self, records):
+        for record in records:
+            self.feed(record)
+        return self.close()
+
+    def update(self, record):
+        self.total += 1
+        self._update_columns(record)
+
+    def _update_columns(self, properties):
+        columns = self.columns
+        for k, v in properties.items():
+            if v is None:
+                continue
+            column = columns.get(k)
+            if column is None:
+                column = columns[k] = ColumnProfile(k)
+            column.update(v)
+
+    def iter_columns(self):
+        """Yield the columns as `add_column` keyword arguments."""
+        for column in self.columns.values():
+            yield {
+                'name': column.name,
+                'column_type': column.column_type,
+                'count': column.count,
+                'occurs': (
+                    column.count == self.total and 1 or 0,
+                    column.max_occurs)}
+
+
+class SchemaProfiler(RecordProfiler):
+    """Infer the columns and the geometry type of GeoJSON features."""
+
+    def __init__(self, sample=None):
+        super().__init__(sample=sample)
+        self.geometries = Counter()
+
+    def update(self, feature):
+        self.total += 1
+        self._update_columns(feature.get('properties') or {})
+
+        geometry = feature.get('geometry')
+        if geometry:
+            self.geometries[geometry.get('type')] += 1
+
+    @property
+    def geometry_type(self):
+        """Return the most frequent geometry type."""
+        common = self.geometries.most_common(1)
+        return common and common[0][0] or None
+
+
+class StructureProfiler(object):
+    """Find the record arrays of a JSON document and infer their columns.
+
+    Records are fed with the path of their array, as read by
+    `jsonstream.RecordReader`, and profiled by array.
+    """
+
+    def __init__(self):
+        self.arrays = OrderedDict()
+
+    def feed(self, path, record):
+        if path not in self.arrays:
+            self.arrays[path] = RecordProfiler()
+        self.arrays[path].feed(record)
+
+    def close(self):
+        for profiler in self.arrays.values():
+            profiler.close()
+        return self
+
+    def profile(self, records):
+        for path, record in records:
+            self.feed(path, record)
+        return self.close()
@@ -14,16 +14,27 @@
 # under the License.
 
 
+import asyncio
+from functools import partial
 from functools import wraps
 import itertools
+from onegeo_manager.cache import CacheEntry
+from onegeo_manager.cache import get_default_cache
+from onegeo_manager.exception import OGCExceptionReport
 from onegeo_manager.index_profile import AbstractIndexProfile
 from onegeo_manager.index_profile import fetch_mapping
+from onegeo_manager.index_profile import format_collection
 from onegeo_manager.index_profile import not_searchable
 from onegeo_manager.resource import AbstractResource
 from onegeo_manager.source import AbstractSource
+from onegeo_manager.source import AsyncSourceMixin
+from onegeo_manager.transport import host_key
+from onegeo_manager.transport import Transport
 from onegeo_manager.utils import clean_my_obj
 import operator
 from owslib import csw
+import re
+import requests
 
 
 __description__ = 'OGC:CSW'
@@ -50,11 +61,74 @@ class Source(AbstractSource):
             'nonGeographicDataset', 'service'],
         'http://www.isotc211.org/2005/gmd': ['dataset', 'series']}
 
-    def __init__(self, url, username=None, password=None):
+    def __init__(self, url, username=None, password=None, cache=None):
         super().__init__(url)
-        self._csw = \
-            csw.CatalogueServiceWeb(url, username=username, password=password)
-        self.capabilities = self._csw.response
+
+        self.username = username
+        self.password = password
+        self.cache = get_default_cache() if cache is None else cache or None
+
+        if not self.cache:
+            self._csw = self._call(
+                csw.CatalogueServiceWeb,
+                url, username=username, password=password)
+            self.capabilities = self._csw.response
+        else:
+            # Capabilities are cached, OWSLib is only used for GetRecords
+            self._csw = csw.CatalogueServiceWeb(
+                url, username=username, password=password, skip_caps=True)
+            self.capabilities = self.__get_capabilities()
+
+    def _call(self, fun, *args, **kwargs):
+        # OWSLib does its own requests: only the retry policy is shared
+        policy = Transport().policy
+
+        def call():
+            try:
+                return fun(*args, **kwargs)
+            except requests.HTTPError as e:
+                # OWSLib raises the 5xx responses: they are retried as
+                # the failed responses of the transport, the other errors
+                # are raised at once
+                if e.response is None \
+                        or not policy.is_failed_response(e.response):
+                    raise
+                return e
+
+        result = policy.call(
+            host_key(self.uri), call,
+            is_failure=lambda r: isinstance(r, requests.HTTPError))
+        if isinstance(result, requests.HTTPError):
+            raise result
+        return result
+
+    def __get_capabilities(self):
+        params = self._capabilities_params()
+        auth = self.username and self.password \
+            and (self.username, self.password) or None
+
+        def load(headers):
+            return self._read_capabilities(Transport().get(
+                self.uri, params=params, auth=auth, headers=headers))
+
+        key = self.cache.key(
+            self.uri, params['version'], self.username, self.password)
+        return self.cache.fetch(key, load)
+
+    def _capabilities_params(self):
+        return {
+            'service': 'CSW',
+            'version': self._csw.version,
+            'request': 'GetCapabilities'}
+
+    @staticmethod
+    def _read_capabilities(r):
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        if re.search(b'<(\\w+:)?ExceptionReport', r.content[:1024]):
+            raise OGCExceptionReport(r.text)
+        return CacheEntry.from_response(r.content, r)
 
     def get_resources(self, *args, **kwargs):
         names = kwargs.pop('names', [])
@@ -129,8 +203,35 @@ class Source(AbstractSource):
             resources.append(resource)
         return resources
 
-    def get_collection(self, resource, step=10, id_record=[]):
+    def get_collection(self, resource, step=10, id_record=[],
+                       checkpoint=None, by_page=False):
+        """Yield the records of a resource, by lists (one per page of the
+        server) if `by_page` is true."""
+
+        outputschema, params = self._records_params(resource, step, id_record)
+        params['startposition'] = checkpoint and self._resume(
+            checkpoint, resource, params, outputschema) or 0
 
+        while True:
+            records = self._get_records(params)
+            page = [self._read_record(resource, rec, outputschema)
+                    for rec in records]
+            if by_page:
+                if page:
+                    yield page
+            else:
+                yield from page
+
+            if checkpoint and records:
+                checkpoint.commit(
+                    params['startposition'] + len(records), page[-1])
+            if len(records) < step:
+                break
+            params['startposition'] += step
+
+        checkpoint and checkpoint.done()
+
+    def _records_params(self, resource, step=10, id_record=[]):
         outputschema = tuple(
             tuple(k for v in l if v == resource.name)[0]
             for k, l in self.OUTPUTSCHEMA.items()
@@ -143,125 +244,210 @@ class Source(AbstractSource):
             'maxrecords': step,
             'outputschema': outputschema,
             'resulttype': 'results',
-            'startposition': 0,
             'typenames': 'csw:Record'}
 
         if len(id_record) > 0:
             params['cql'] += " AND (identifier='{1}')".format(
                 resource.name, "' OR identifier='".join(id_record))
 
-        while True:
-            self._csw.getrecords2(**params)
-            records = list(self._csw.records.values())
-            for rec in records:
-                data = {}
-                if rec.__class__.__name__ == 'MD_Metadata':
-
-                    resolution = []
-                    distance = rec.identification.distance
-                    uom = rec.identification.uom
-                    if len(distance) == len(uom):
-                        for i in range(len(distance)):
-                            resolution.append({
-                                'uom': uom[i], 'distance': distance[i]})
-
-                    contact = []
-                    if rec.identification.contact:
-                        for m in rec.identification.contact:
-                            if m.__class__.__name__ == 'CI_ResponsibleParty':
-                                d = {}
-                                for k in m.__dict__.keys():
-                                    v = getattr(m, k)
-                                    if v.__class__.__name__ == 'CI_OnlineResource':
-                                        v = v.__dict__
-                                    d[k] = v
-                                contact.append(d)
-
-                    uris = []
-                    if rec.distribution and rec.distribution.online:
-                        for m in rec.distribution.online:
-                            if m.__class__.__name__ == 'CI_ResponsibleParty':
-                                uris.append(m.__dict__)
-
-                    data.update(**{
-                        'abstract': rec.identification.abstract,
-                        'bbox': rec.identification.bbox and {
-                            'type': 'Polygon',
-                            'coordinates': [[
-                                [rec.identification.bbox.minx,
-                                 rec.identification.bbox.miny],
-                                [rec.identification.bbox.maxx,
-                                 rec.identification.bbox.miny],
-                                [rec.identification.bbox.maxx,
-                                 rec.identification.bbox.maxy],
-                                [rec.identification.bbox.minx,
-                                 rec.identification.bbox.maxy],
-                                [rec.identification.bbox.minx,
-                                 rec.identification.bbox.miny]]]},
-                        'classification': rec.identification.classification,
-                        'contact': contact,
-                        'date_publication': rec.identification.date and [
-                            m.date for m in rec.identification.date
-                            if m.__class__.__name__ == 'CI_Date'
-                            and m.type == 'publication'],
-                        'denominators': rec.identification.denominators,
-                        'identifier': rec.identifier,
-                        'keyword': [y for x in [
-                            m.keywords for m in rec.identification.keywords2
-                            if m.__class__.__name__ == 'MD_Keywords']
-                            for y in x],
-                        'lineage': rec.dataquality.lineage,
-                        'parent_identifier': rec.parentidentifier,
-                        'resolution': resolution,
-                        'rights': list(itertools.chain(
-                            rec.identification.accessconstraints,
-                            rec.identification.securityconstraints,
-                            rec.identification.otherconstraints)),
-                        'spatial_type':
-                            rec.identification.spatialrepresentationtype,
-                        'standard': {
-                            'name': rec.stdname,
-                            'version': rec.stdver},
-                        'title': rec.identification.title,
-                        'type': rec.hierarchy,
-                        'topic_category': rec.identification.topiccategory,
-                        'use_constraints': rec.identification.useconstraints,
-                        'use_limitation': rec.identification.uselimitation,
-                        'uris': uris,
-                        'xml': rec.xml.decode('utf-8')})
-
-                if rec.__class__.__name__ == 'CswRecord':
-                    for col in resource.iter_columns():
-                        try:
-                            attr = getattr(rec, col['name'])
-                        except AttributeError:
-                            data[col['name']] = None
-                            continue
-                        if col['name'] == 'bbox_wgs84' \
-                                and col['type'] == 'geo_shape' and attr:
-                            attr = {
-                                'type': 'Polygon',
-                                'coordinates': [[
-                                    [attr.minx, attr.miny],
-                                    [attr.maxx, attr.miny],
-                                    [attr.maxx, attr.maxy],
-                                    [attr.minx, attr.maxy],
-                                    [attr.minx, attr.miny]]]}
-
-                        data[col['name']] = \
-                            isinstance(attr, bytes) and attr.decode() or attr
-
-                data.update(schema=outputschema)
-
-                yield clean_my_obj(data, fading=False)
+        return outputschema, params
+
+    def _resume(self, checkpoint, resource, params, outputschema):
+        """Bind `checkpoint` and return the position to resume from."""
+        cursor = checkpoint.bind(self.uri, resource.name, params)
+        if cursor:
+            records = self._get_records(
+                dict(params, maxrecords=1, startposition=cursor - 1))
+            cursor = checkpoint.check(self._read_record(
+                resource, records[0], outputschema) if records else None)
+        return cursor
+
+    def _get_records(self, params):
+        self._call(self._csw.getrecords2, **params)
+        return list(self._csw.records.values())
+
+    def _read_record(self, resource, rec, outputschema):
+        data = {}
+        if rec.__class__.__name__ == 'MD_Metadata':
+
+            resolution = []
+            distance = rec.identification.distance
+            uom = rec.identification.uom
+            if len(distance) == len(uom):
+                for i in range(len(distance)):
+                    resolution.append({
+                        'uom': uom[i], 'distance': distance[i]})
+
+            contact = []
+            if rec.identification.contact:
+                for m in rec.identification.contact:
+                    if m.__class__.__name__ == 'CI_ResponsibleParty':
+                        d = {}
+                        for k in m.__dict__.keys():
+                            v = getattr(m, k)
+                            if v.__class__.__name__ == 'CI_OnlineResource':
+                                v = v.__dict__
+                            d[k] = v
+                        contact.append(d)
+
+            uris = []
+            if rec.distribution and rec.distribution.online:
+                for m in rec.distribution.online:
+                    if m.__class__.__name__ == 'CI_ResponsibleParty':
+                        uris.append(m.__dict__)
+
+            data.update(**{
+                'abstract': rec.identification.abstract,
+                'bbox': rec.identification.bbox and {
+                    'type': 'Polygon',
+                    'coordinates': [[
+                        [rec.identification.bbox.minx,
+                         rec.identification.bbox.miny],
+                        [rec.identification.bbox.maxx,
+                         rec.identification.bbox.miny],
+                        [rec.identification.bbox.maxx,
+                         rec.identification.bbox.maxy],
+                        [rec.identification.bbox.minx,
+                         rec.identification.bbox.maxy],
+                        [rec.identification.bbox.minx,
+                         rec.identification.bbox.miny]]]},
+                'classification': rec.identification.classification,
+                'contact': contact,
+                'date_publication': rec.identification.date and [
+                    m.date for m in rec.identification.date
+                    if m.__class__.__name__ == 'CI_Date'
+                    and m.type == 'publication'],
+                'denominators': rec.identification.denominators,
+                'identifier': rec.identifier,
+                'keyword': [y for x in [
+                    m.keywords for m in rec.identification.keywords2
+                    if m.__class__.__name__ == 'MD_Keywords']
+                    for y in x],
+                'lineage': rec.dataquality.lineage,
+                'parent_identifier': rec.parentidentifier,
+                'resolution': resolution,
+                'rights': list(itertools.chain(
+                    rec.identification.accessconstraints,
+                    rec.identification.securityconstraints,
+                    rec.identification.otherconstraints)),
+                'spatial_type':
+                    rec.identification.spatialrepresentationtype,
+                'standard': {
+                    'name': rec.stdname,
+                    'version': rec.stdver},
+                'title': rec.identification.title,
+                'type': rec.hierarchy,
+                'topic_category': rec.identification.topiccategory,
+                'use_constraints': rec.identification.useconstraints,
+                'use_limitation': rec.identification.uselimitation,
+                'uris': uris,
+                'xml': rec.xml.decode('utf-8')})
+
+        if rec.__class__.__name__ == 'CswRecord':
+            for col in resource.iter_columns():
+                try:
+                    attr = getattr(rec, col['name'])
+                except AttributeError:
+                    data[col['name']] = None
+                    continue
+                if col['name'] == 'bbox_wgs84' \
+                        and col['type'] == 'geo_shape' and attr:
+                    attr = {
+                        'type': 'Polygon',
+                        'coordinates': [[
+                            [attr.minx, attr.miny],
+                            [attr.maxx, attr.miny],
+                            [attr.maxx, attr.maxy],
+                            [attr.minx, attr.maxy],
+                            [attr.minx, attr.miny]]]}
+
+                data[col['name']] = \
+                    isinstance(attr, bytes) and attr.decode() or attr
+
+        data.update(schema=outputschema)
+
+        return clean_my_obj(data, fading=False)
+
+
+class AsyncSource(AsyncSourceMixin, Source):
+    """asyncio counterpart of `Source`.
+
+    OWSLib is not asynchronous: its GetRecords calls run in the default
+    executor, one page at a time. The capabilities are loaded through
+    the `AsyncTransport` when entering the async context.
+    """
+
+    def __init__(self, url, username=None, password=None, cache=None,
+                 transport=None):
+        AbstractSource.__init__(self, url)
+
+        self.username = username
+        self.password = password
+        self.cache = get_default_cache() if cache is None else cache or None
+
+        self._init_transport(transport)
+
+    async def _open(self):
+        self._csw = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: csw.CatalogueServiceWeb(
+                self.uri, username=self.username, password=self.password,
+                skip_caps=True))
+        self.capabilities = await self._get_capabilities()
+
+    async def _get_capabilities(self):
+        params = self._capabilities_params()
+        auth = self.username and self.password \
+            and (self.username, self.password) or None
+
+        async def load(headers):
+            return self._read_capabilities(await self.transport.get(
+                self.uri, params=params, auth=auth, headers=headers))
+
+        if not self.cache:
+            return (await load({})).value
+
+        key = self.cache.key(
+            self.uri, params['version'], self.username, self.password)
+        return await self.cache.afetch(key, load)
+
+    async def get_resources(self, *args, **kwargs):
+        return Source.get_resources(self, *args, **kwargs)
+
+    async def get_collection(self, resource, step=10, id_record=[],
+                             checkpoint=None, by_page=False):
+
+        outputschema, params = self._records_params(resource, step, id_record)
+        loop = asyncio.get_event_loop()
+        params['startposition'] = checkpoint and await loop.run_in_executor(
+            None, self._resume, checkpoint, resource, params,
+            outputschema) or 0
 
+        while True:
+            records = await loop.run_in_executor(
+                None, self._get_records, dict(params))
+            page = [self._read_record(resource, rec, outputschema)
+                    for rec in records]
+            if by_page:
+                if page:
+                    yield page
+            else:
+                for record in page:
+                    yield record
+
+            if checkpoint and records:
+                checkpoint.commit(
+                    params['startposition'] + len(records), page[-1])
             if len(records) < step:
                 break
             params['startposition'] += step
 
+        checkpoint and checkpoint.done()
+
 
 class IndexProfile(AbstractIndexProfile):
 
+    PAGED_COLLECTION = True
+
     def __init__(self, name, resource):
         super().__init__(name, resource)
 
@@ -272,37 +458,29 @@ class IndexProfile(AbstractIndexProfile):
 
         @wraps(fun)
         def wrapper(self, *args, **kwargs):
-
-            for record in fun(self, *args, **kwargs):
-
-                properties, _backuped = {}, {}
-                for k, v in record.items():
-                    prop = self.get_property(k)
-                    if prop.rejected:
-                        _backuped[prop.name] = v
-                    else:
-                        properties[prop.alias or prop.name] = v
-
-                xml = 'xml' in record and record.pop('xml') or None
-                uris = 'uris' in record and record.pop('uris') or None
-                geometry = 'bbox' in record and record.pop('bbox') or None
-
-                yield {
-                    '_backup': _backuped,
-                    '_md5': None,
-                    'lineage': {
-                        'resource': {
-                            'name': self.resource.name},
-                        'source': {
-                            'protocol': self.resource.source.protocol,
-                            'uri': self.resource.source.uri}},
-                    'properties': properties,
-                    'geometry': geometry,
-                    'uri': uris,
-                    'xml': isinstance(xml, bytes) and xml.decode('utf-8') or xml}
+            transformer = self.compile_transformer(
+                geometry='bbox',
+                lineage={
+                    'resource': {
+                        'name': self.resource.name},
+                    'source': {
+                        'protocol': self.resource.source.protocol,
+                        'uri': self.resource.source.uri}})
+            return format_collection(
+                partial(self._format_record, transformer=transformer),
+                fun(self, *args, **kwargs), by_page=kwargs.get('by_page'))
 
         return wrapper
 
+    @staticmethod
+    def _format_record(record, transformer):
+        document = transformer(record)
+        xml = record.get('xml')
+        document['uri'] = record.get('uris') or None
+        document['xml'] = isinstance(xml, bytes) and xml.decode('utf-8') \
+            or xml or None
+        return document
+
     @_format
     def get_collection(self, **opts):
         return self.resource.source.get_collection(self.resource, **opts)
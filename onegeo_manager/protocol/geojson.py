@@ -14,19 +14,34 @@
 # under the License.
 
 
+import asyncio
 from functools import wraps
 import geojson
+from itertools import chain
 from onegeo_manager.exception import UnexpectedError
+from onegeo_manager.fileio import CHUNK_SIZE
+from onegeo_manager.fileio import decompress_chunks
+from onegeo_manager.fileio import Decompressor
+from onegeo_manager.fileio import iter_file
+from onegeo_manager.fileio import open_file
 from onegeo_manager.index_profile import AbstractIndexProfile
 from onegeo_manager.index_profile import fetch_mapping
+from onegeo_manager.index_profile import format_collection
 from onegeo_manager.index_profile import not_searchable
+from onegeo_manager.jsonstream import ArrayReader
+from onegeo_manager.jsonstream import iter_array
+from onegeo_manager.profiler import SchemaProfiler
 from onegeo_manager.resource import AbstractResource
 from onegeo_manager.source import AbstractSource
+from onegeo_manager.source import AsyncSourceMixin
+from onegeo_manager.transport import is_compressed_response
+from onegeo_manager.transport import iter_prefetched
+from onegeo_manager.transport import response_name
+from onegeo_manager.transport import Transport
 from onegeo_manager.utils import clean_my_obj
 from onegeo_manager.utils import digest_object
 from pathlib import Path
 import re
-import requests
 
 
 __description__ = 'GeoJSON'
@@ -52,49 +67,76 @@ class Resource(AbstractResource):
         self.geometry = geom_type
 
     def get_collection(self):
-        yield from self.source._data['features']
+        return self.source._iter_features()
 
 
 class Source(AbstractSource):
 
+    CONTENT_TYPE = r'^(text|application)\/((\w+)\+?)+\;?(((\s?\w+\=[\w\d\D]+)|(subtype\=geojson));?)*$'
+
     def __init__(self, uri):
         super().__init__(uri)
 
-    @property
-    def _data(self):
+    def _chunks(self):
         if self.uri.startswith('file://'):
             p = Path(self.uri[7:])
             if not p.exists():
                 raise ConnectionError('The given path does not exist.')
-            with open(p) as f:
-                return geojson.load(f)
+            yield from iter_file(p)
 
         if self.uri.startswith('http'):
-            r = requests.get(self.uri)
-            if r.status_code == 200:
-                r.raise_for_status()
-            pattern = '^(text|application)\/((\w+)\+?)+\;?(((\s?\w+\=[\w\d\D]+)|(subtype\=geojson));?)*$'
-            if re.match(pattern, r.headers['Content-Type']):
-                return geojson.loads(r._content.decode('utf-8'))
-
-    def get_resources(self, *args, **kwargs):
-        data = self._data
-        if data.errors():
-            raise Exception(data.errors())
-        if data.__class__.__qualname__ == 'FeatureCollection':
-            features = data['features']
-            feature = len(features) > 0 and features[0]
-            properties = feature.get('properties', None)
-            geometry = feature.get('geometry', None)
-        else:
+            r = Transport().get(self.uri, stream=True)
+            try:
+                self._check_response(r)
+            except Exception:
+                r.close()
+                raise
+            # The response is closed by the thread reading it
+            yield from decompress_chunks(
+                iter_prefetched(r.iter_content(CHUNK_SIZE), close=r.close),
+                name=response_name(r))
+
+    def _check_response(self, r):
+        r.raise_for_status()
+        if is_compressed_response(r):
+            return
+        if not re.match(self.CONTENT_TYPE, r.headers['Content-Type']):
+            raise UnexpectedError(
+                "Unexpected content type '{0}'.".format(
+                    r.headers['Content-Type']))
+
+    def _iter_features(self, reader=None):
+        """Yield the features one at a time while the document is read."""
+        yield from iter_array(self._chunks(), 'features', reader=reader)
+
+    def get_resources(self, *args, sample=None, **kwargs):
+        # The whole collection is profiled in a single pass, or only a
+        # reservoir sample of `sample` features
+        reader = ArrayReader('features')
+        features = self._iter_features(reader=reader)
+        feature = next(features, None)
+        self._check_feature(feature)
+        profiler = SchemaProfiler(sample=sample)
+        if feature is not None:
+            profiler.profile(chain([feature], features))
+        return self._read_resources(reader, profiler)
+
+    @staticmethod
+    def _check_feature(feature):
+        if feature is not None:
+            errors = geojson.GeoJSON.to_instance(feature).errors()
+            if errors:
+                raise Exception(errors)
+
+    def _read_resources(self, reader, profiler):
+        if not reader.found or reader.members.get(
+                'type', 'FeatureCollection') != 'FeatureCollection':
             raise Exception('No FeatureCollection found')
 
         resource = Resource(self)
-        if properties:
-            for item in properties.keys():
-                resource.add_column(item)
-        if geometry:
-            resource.set_geometry_column(geometry.get('type'))
+        resource.add_columns(profiler.iter_columns())
+        if profiler.geometry_type:
+            resource.set_geometry_column(profiler.geometry_type)
         return [resource]
 
     def get_collection(self, resource):
@@ -102,6 +144,59 @@ class Source(AbstractSource):
         yield from resource.get_collection()
 
 
+class AsyncSource(AsyncSourceMixin, Source):
+    """asyncio counterpart of `Source`."""
+
+    def __init__(self, uri, transport=None):
+        AbstractSource.__init__(self, uri)
+
+        self._init_transport(transport)
+
+    async def _chunks(self):
+        if self.uri.startswith('file://'):
+            p = Path(self.uri[7:])
+            if not p.exists():
+                raise ConnectionError('The given path does not exist.')
+            loop = asyncio.get_event_loop()
+            with open_file(p) as f:
+                while True:
+                    chunk = await loop.run_in_executor(
+                        None, f.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        if self.uri.startswith('http'):
+            r = await self.transport.get(self.uri, stream=True)
+            try:
+                self._check_response(r)
+                decompressor = Decompressor(response_name(r))
+                async for chunk in r.iter_content(CHUNK_SIZE):
+                    yield decompressor.feed(chunk)
+                yield decompressor.close()
+            finally:
+                r.close()
+
+    async def _iter_features(self, reader=None):
+        reader = reader or ArrayReader('features')
+        async for chunk in self._chunks():
+            for feature in reader.feed(chunk):
+                yield feature
+        for feature in reader.close():
+            yield feature
+
+    async def get_resources(self, *args, sample=None, **kwargs):
+        reader = ArrayReader('features')
+        profiler = SchemaProfiler(sample=sample)
+        checked = False
+        async for feature in self._iter_features(reader=reader):
+            if not checked:
+                self._check_feature(feature)
+                checked = True
+            profiler.feed(feature)
+        return self._read_resources(reader, profiler.close())
+
+
 class IndexProfile(AbstractIndexProfile):
 
     def __init__(self, name, resource):
@@ -111,33 +206,22 @@ class IndexProfile(AbstractIndexProfile):
 
         @wraps(fun)
         def wrapper(self, *args, **kwargs):
-            for record in fun(self, *args, **kwargs):
-
-                properties, _backuped = {}, {}
-                for k, v in record['properties'].items():
-                    prop = self.get_property(k)
-                    if prop.rejected:
-                        _backuped[prop.name] = v
-                    else:
-                        properties[prop.alias or prop.name] = v
-
-                yield {
-                    '_backup': _backuped,
-                    '_md5': digest_object(record),
-                    'geometry': record.get('geometry'),
-                    'lineage': {
-                        # 'resource': {
-                        #     'name': self.resource.name},
-                        'source': {
-                            'protocol': self.resource.source.protocol,
-                            'uri': self.resource.source.uri}},
-                    'properties': properties}
+            transformer = self.compile_transformer(
+                properties='properties', digest=digest_object,
+                geometry='geometry',
+                lineage={
+                    # 'resource': {
+                    #     'name': self.resource.name},
+                    'source': {
+                        'protocol': self.resource.source.protocol,
+                        'uri': self.resource.source.uri}})
+            return format_collection(transformer, fun(self, *args, **kwargs))
 
         return wrapper
 
     @_format
     def get_collection(self, **opts):
-        yield from self.resource.get_collection(**opts)
+        return self.resource.get_collection(**opts)
 
     def generate_elastic_mapping(self):
 
@@ -159,6 +243,9 @@ class IndexProfile(AbstractIndexProfile):
         return clean_my_obj({
             self.name: {
                 'properties': {
+                    # Byte savings of the geometry reducer, not indexed
+                    '_geometry': self.geometry_reducer and {
+                        'type': 'object', 'enabled': False} or None,
                     'geometry': geometry_mapping,
                     'lineage': {
                         'properties': {
@@ -0,0 +1,168 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from onegeo_manager.codec import loads
+from onegeo_manager.exception import NotYetImplemented
+from onegeo_manager.exception import UnexpectedError
+from onegeo_manager.fileio import CHUNK_SIZE
+from onegeo_manager.fileio import decompress_chunks
+from onegeo_manager.fileio import get_shards
+from onegeo_manager.fileio import iter_lines
+from onegeo_manager.fileio import split_lines
+from onegeo_manager.profiler import SchemaProfiler
+from onegeo_manager.protocol import geojson
+from onegeo_manager.source import AbstractSource
+from onegeo_manager.transport import is_compressed_response
+from onegeo_manager.transport import iter_prefetched
+from onegeo_manager.transport import response_name
+from onegeo_manager.transport import Transport
+import os
+from pathlib import Path
+import re
+
+
+__description__ = 'GeoJSON Text Sequence'
+
+
+RS = b'\x1e'
+
+
+class Resource(geojson.Resource):
+
+    def __init__(self, source):
+        super().__init__(source)
+
+    def get_collection(self, shard=None):
+        return self.source._iter_features(shard=shard)
+
+
+class Source(AbstractSource):
+    """Newline-delimited GeoJSON (RFC 8142 or NDJSON).
+
+    Each line holds one GeoJSON text, optionally prefixed by a record
+    separator: a Feature, a FeatureCollection or a bare geometry.
+    """
+
+    CONTENT_TYPE = r'^(text|application)\/[\w.+-]+(\s*;.*)?$'
+
+    def __init__(self, uri):
+        super().__init__(uri)
+
+    def _path(self):
+        p = Path(self.uri[7:])
+        if not p.exists():
+            raise ConnectionError('The given path does not exist.')
+        return p
+
+    def _lines(self, shard=None):
+        if self.uri.startswith('file://'):
+            start, end = shard or (0, None)
+            yield from iter_lines(self._path(), start=start, end=end)
+
+        if self.uri.startswith('http'):
+            if shard:
+                raise NotYetImplemented('Only local files can be sharded.')
+            r = Transport().get(self.uri, stream=True)
+            try:
+                self._check_response(r)
+            except Exception:
+                r.close()
+                raise
+            # The response is closed by the thread reading it
+            yield from split_lines(decompress_chunks(
+                iter_prefetched(r.iter_content(CHUNK_SIZE), close=r.close),
+                name=response_name(r)))
+
+    def _check_response(self, r):
+        r.raise_for_status()
+        if is_compressed_response(r):
+            return
+        if not re.match(self.CONTENT_TYPE, r.headers['Content-Type']):
+            raise UnexpectedError(
+                "Unexpected content type '{0}'.".format(
+                    r.headers['Content-Type']))
+
+    def _iter_features(self, shard=None):
+        """Yield the features of the sequence, or of a shard of it."""
+        for line in self._lines(shard=shard):
+            text = line.strip()
+            if text.startswith(RS):
+                text = text.lstrip(RS).strip()
+                truncated = True
+            else:
+                truncated = False
+            if not text:
+                continue
+            try:
+                obj = loads(text)
+            except ValueError:
+                # Truncated texts of a sequence are skipped (RFC 8142)
+                if truncated:
+                    continue
+                raise UnexpectedError(
+                    'Invalid GeoJSON text: {0}'.format(text[:80]))
+            yield from self._as_features(obj)
+
+    @staticmethod
+    def _as_features(obj):
+        kind = obj.get('type')
+        if kind == 'Feature':
+            yield obj
+        elif kind == 'FeatureCollection':
+            yield from obj.get('features', [])
+        elif kind in geojson.Resource.GEOMETRY_TYPE:
+            yield {'type': 'Feature', 'geometry': obj, 'properties': {}}
+        else:
+            raise UnexpectedError(
+                "Unexpected GeoJSON type '{0}'.".format(kind))
+
+    def get_shards(self, count=None):
+        """Split the file into byte ranges to be read by different workers.
+
+        Each shard is given to `Resource.get_collection` (or to the
+        `get_collection` method of an index profile) of its worker.
+        """
+        if not self.uri.startswith('file://'):
+            raise NotYetImplemented('Only local files can be sharded.')
+        return get_shards(self._path(), count or os.cpu_count() or 1)
+
+    def get_resources(self, *args, sample=None, **kwargs):
+        # The whole sequence is profiled in a single pass, or only a
+        # reservoir sample of `sample` features
+        profiler = SchemaProfiler(sample=sample)
+        checked = False
+        for feature in self._iter_features():
+            if not checked:
+                geojson.Source._check_feature(feature)
+                checked = True
+            profiler.feed(feature)
+        profiler.close()
+
+        resource = Resource(self)
+        resource.add_columns(profiler.iter_columns())
+        if profiler.geometry_type:
+            resource.set_geometry_column(profiler.geometry_type)
+        return [resource]
+
+    def get_collection(self, resource, shard=None):
+        # Deprecated -> Use Resource.get_collection()
+        yield from resource.get_collection(shard=shard)
+
+
+class IndexProfile(geojson.IndexProfile):
+
+    def __init__(self, name, resource):
+        super().__init__(name, resource)
@@ -14,23 +14,38 @@
 # under the License.
 
 
-from collections import Counter
+import asyncio
 from functools import wraps
-import json
-import numpy as np
+from onegeo_manager.cache import CacheEntry
+from onegeo_manager.cache import get_default_document_cache
+from onegeo_manager.codec import loads
+from onegeo_manager.codec import response_body
+from onegeo_manager.exception import UnexpectedError
+from onegeo_manager.fileio import CHUNK_SIZE
+from onegeo_manager.fileio import decompress_chunks
+from onegeo_manager.fileio import Decompressor
+from onegeo_manager.fileio import iter_file
+from onegeo_manager.fileio import open_buffer
+from onegeo_manager.fileio import open_file
 from onegeo_manager.index_profile import AbstractIndexProfile
 from onegeo_manager.index_profile import fetch_mapping
+from onegeo_manager.index_profile import format_collection
 from onegeo_manager.index_profile import not_searchable
+from onegeo_manager.jsonstream import iter_records
+from onegeo_manager.jsonstream import RecordReader
+from onegeo_manager.jsonstream import walk_records
+from onegeo_manager.profiler import StructureProfiler
 from onegeo_manager.resource import AbstractResource
 from onegeo_manager.source import AbstractSource
-from onegeo_manager.utils import accumulate
+from onegeo_manager.source import AsyncSourceMixin
+from onegeo_manager.transport import is_compressed_response
+from onegeo_manager.transport import iter_prefetched
+from onegeo_manager.transport import response_name
+from onegeo_manager.transport import Transport
 from onegeo_manager.utils import clean_my_obj
 from onegeo_manager.utils import digest_object
-from onegeo_manager.utils import iterate
-import operator
 from pathlib import Path
 import re
-import requests
 
 
 __description__ = 'JSON'
@@ -41,7 +56,8 @@ class Resource(AbstractResource):
     _path = None
 
     def __init__(self, source, path=None):
-        self._path = path
+        # The path of the record array, as the names of the members
+        self._path = isinstance(path, str) and (path,) or path
         super().__init__(source)
 
     @property
@@ -57,56 +73,116 @@ class Resource(AbstractResource):
         raise AttributeError("Attibute is locked, you can't delete it.")
 
     def get_collection(self):
-        yield from self.source._data[self._path]
+        return self.source._iter_records(self._path)
 
 
 class Source(AbstractSource):
 
-    def __init__(self, uri):
+    CONTENT_TYPE = r'^(text|application)\/((\w+)\+?)+\;?((\s?\w+\=[\w\d\D]+);?)*$'
+
+    def __init__(self, uri, cache=None, stream=False):
         super().__init__(uri)
 
+        self.cache = \
+            get_default_document_cache() if cache is None else cache or None
+        # With `stream`, collections are read by chunks instead of from
+        # the decoded (and cached) document
+        self.stream = stream
+
     @property
     def _data(self):
+        # The cache holds the raw documents, decoded on every access
+        if self.uri.startswith('file://'):
+            if not self.cache:
+                return self._read_file()
+            return loads(
+                self.cache.fetch_file(self._path(), self._read_content))
+
+        if self.uri.startswith('http'):
+            if not self.cache:
+                return self._read_response(Transport().get(self.uri))
+
+            def load(headers):
+                r = Transport().get(self.uri, headers=headers)
+                if r.status_code == 304:
+                    return None
+                content = self._response_content(r)
+                return CacheEntry.from_response(content, r, size=len(content))
+
+            return loads(self.cache.fetch(self.cache.key(self.uri), load))
+
+    def _path(self):
+        p = Path(self.uri[7:])
+        if not p.exists():
+            raise ConnectionError('The given path does not exist.')
+        return p
+
+    def _read_file(self):
+        with open_buffer(self._path()) as buf:
+            return loads(buf)
+
+    def _read_content(self):
+        with open_buffer(self._path()) as buf:
+            return bytes(buf)
+
+    def _chunks(self):
         if self.uri.startswith('file://'):
-            p = Path(self.uri[7:])
-            if not p.exists():
-                raise ConnectionError('The given path does not exist.')
-            with open(p) as f:
-                return json.load(f)
+            yield from iter_file(self._path())
 
         if self.uri.startswith('http'):
-            r = requests.get(self.uri)
-            if r.status_code == 200:
-                r.raise_for_status()
-            pattern = '^(text|application)\/((\w+)\+?)+\;?((\s?\w+\=[\w\d\D]+);?)*$'
-            s = re.search(pattern, r.headers['Content-Type'])
-            if s and s.group(2) == 'json':
-                return r.json()
+            r = Transport().get(self.uri, stream=True)
+            try:
+                self._check_response(r)
+            except Exception:
+                r.close()
+                raise
+            # The response is closed by the thread reading it
+            yield from decompress_chunks(
+                iter_prefetched(r.iter_content(CHUNK_SIZE), close=r.close),
+                name=response_name(r))
+
+    @classmethod
+    def _check_response(cls, r):
+        r.raise_for_status()
+        if is_compressed_response(r):
+            return
+        s = re.search(cls.CONTENT_TYPE, r.headers['Content-Type'])
+        if not s or s.group(2) != 'json':
+            raise UnexpectedError(
+                "Unexpected content type '{0}'.".format(
+                    r.headers['Content-Type']))
+
+    @classmethod
+    def _read_response(cls, r):
+        return loads(cls._response_content(r))
+
+    @classmethod
+    def _response_content(cls, r):
+        cls._check_response(r)
+        if is_compressed_response(r):
+            return b''.join(
+                decompress_chunks([r.content], name=response_name(r)))
+        return response_body(r)
+
+    def _iter_records(self, path):
+        if self.stream:
+            records = iter_records(self._chunks())
+        else:
+            records = walk_records(self._data)
+        for p, record in records:
+            if p == path:
+                yield record
 
     def get_resources(self, *args, **kwargs):
+        # The document is profiled while it is read by chunks
+        return self._read_resources(
+            StructureProfiler().profile(iter_records(self._chunks())))
 
-        # Deconstructs json data
-        counter = Counter(path for path, value in iterate(self._data))
-        # Then returns statistics of this one
-        inputted = (
-            (v, k)
-            for k, v in sorted(counter.items(), key=operator.itemgetter(1)))
-
-        # This is for testing with simple-feature...
-        occurs = []
-        structures = []
-        for occur, parent, children in tuple(accumulate(inputted)):
-            occurs.append(occur)
-            structures.append(
-                children and (parent, children) or (parent,))
-
-        test = tuple(occurs > np.std(occurs))
+    def _read_resources(self, profiler):
         resources = []
-        for i in [test.index(v) for v in test if v]:
-            structure = structures[i]
-            resource = Resource(self, path=structure[0])
-            for item in structure[1]:
-                resource.add_column(item)
+        for path, records in profiler.arrays.items():
+            resource = Resource(self, path=path)
+            resource.add_columns(records.iter_columns())
             resources.append(resource)
         return resources
 
@@ -115,6 +191,85 @@ class Source(AbstractSource):
         yield from resource.get_collection()
 
 
+class AsyncSource(AsyncSourceMixin, Source):
+    """asyncio counterpart of `Source`."""
+
+    def __init__(self, uri, cache=None, stream=False, transport=None):
+        AbstractSource.__init__(self, uri)
+
+        self.cache = \
+            get_default_document_cache() if cache is None else cache or None
+        self.stream = stream
+
+        self._init_transport(transport)
+
+    async def _get_data(self):
+        if self.uri.startswith('file://'):
+            return await asyncio.get_event_loop().run_in_executor(
+                None, lambda: self._data)
+
+        if self.uri.startswith('http'):
+            if not self.cache:
+                return self._read_response(
+                    await self.transport.get(self.uri))
+
+            async def load(headers):
+                r = await self.transport.get(self.uri, headers=headers)
+                if r.status_code == 304:
+                    return None
+                content = self._response_content(r)
+                return CacheEntry.from_response(content, r, size=len(content))
+
+            return loads(
+                await self.cache.afetch(self.cache.key(self.uri), load))
+
+    async def _chunks(self):
+        if self.uri.startswith('file://'):
+            loop = asyncio.get_event_loop()
+            with open_file(self._path()) as f:
+                while True:
+                    chunk = await loop.run_in_executor(
+                        None, f.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        if self.uri.startswith('http'):
+            r = await self.transport.get(self.uri, stream=True)
+            try:
+                self._check_response(r)
+                decompressor = Decompressor(response_name(r))
+                async for chunk in r.iter_content(CHUNK_SIZE):
+                    yield decompressor.feed(chunk)
+                yield decompressor.close()
+            finally:
+                r.close()
+
+    async def _iter_all_records(self):
+        reader = RecordReader()
+        async for chunk in self._chunks():
+            for item in reader.feed(chunk):
+                yield item
+        for item in reader.close():
+            yield item
+
+    async def _iter_records(self, path):
+        if self.stream:
+            async for p, record in self._iter_all_records():
+                if p == path:
+                    yield record
+            return
+        for p, record in walk_records(await self._get_data()):
+            if p == path:
+                yield record
+
+    async def get_resources(self, *args, **kwargs):
+        profiler = StructureProfiler()
+        async for path, record in self._iter_all_records():
+            profiler.feed(path, record)
+        return self._read_resources(profiler.close())
+
+
 class IndexProfile(AbstractIndexProfile):
 
     def __init__(self, name, resource):
@@ -124,32 +279,21 @@ class IndexProfile(AbstractIndexProfile):
 
         @wraps(fun)
         def wrapper(self, *args, **kwargs):
-            for record in fun(self, *args, **kwargs):
-
-                properties, _backuped = {}, {}
-                for k, v in record.items():
-                    prop = self.get_property(k)
-                    if prop.rejected:
-                        _backuped[prop.name] = v
-                    else:
-                        properties[prop.alias or prop.name] = v
-
-                yield {
-                    '_backup': _backuped,
-                    '_md5': digest_object(record),
-                    'lineage': {
-                        # 'resource': {
-                        #     'name': self.resource.name},
-                        'source': {
-                            'protocol': self.resource.source.protocol,
-                            'uri': self.resource.source.uri}},
-                    'properties': properties}
+            transformer = self.compile_transformer(
+                digest=digest_object,
+                lineage={
+                    # 'resource': {
+                    #     'name': self.resource.name},
+                    'source': {
+                        'protocol': self.resource.source.protocol,
+                        'uri': self.resource.source.uri}})
+            return format_collection(transformer, fun(self, *args, **kwargs))
 
         return wrapper
 
     @_format
     def get_collection(self, **opts):
-        yield from self.resource.get_collection(**opts)
+        return self.resource.get_collection(**opts)
 
     def generate_elastic_mapping(self):
 
@@ -17,6 +17,8 @@
 from base64 import b64encode
 from functools import wraps
 import gc
+from onegeo_manager.fileio import as_stream
+from onegeo_manager.fileio import open_buffer
 from onegeo_manager.index_profile import AbstractIndexProfile
 from onegeo_manager.index_profile import fetch_mapping
 # from onegeo_manager.index_profile import not_searchable
@@ -32,6 +34,16 @@ import re
 __description__ = 'PDF Store'
 
 
+# Compressed documents are read too
+PATTERNS = ('**/*.[pP][dD][fF]', '**/*.[pP][dD][fF].bz2',
+            '**/*.[pP][dD][fF].gz', '**/*.[pP][dD][fF].xz')
+
+
+def iter_documents(p):
+    for pattern in PATTERNS:
+        yield from p.glob(pattern)
+
+
 class Resource(AbstractResource):
 
     def __init__(self, source, uri=None):
@@ -55,7 +67,7 @@ class Resource(AbstractResource):
 
     def get_collection(self):
 
-        for path in list(self._p.glob('**/*.[pP][dD][fF]')):
+        for path in list(iter_documents(self._p)):
 
             filename = '/'.join(path.parts[len(self._p.parts):])
             doc = {
@@ -66,14 +78,17 @@ class Resource(AbstractResource):
             gc.collect(generation=2)
 
             info = {}
-            with open(path.as_posix(), 'rb') as f:
+            with open_buffer(path) as buf:
                 try:
-                    info = PyPDF2.PdfFileReader(f).getDocumentInfo()
+                    info = PyPDF2.PdfFileReader(
+                        as_stream(buf)).getDocumentInfo()
                 except Exception:
                     pass
+                raw = b64encode(buf)
 
-            with open(path.as_posix(), 'rb') as f:
-                doc['raw'] = b64encode(f.read()).decode('utf-8')
+            doc['md5'] = digest_binary(raw)
+            doc['raw'] = raw.decode('utf-8')
+            del raw
 
             for k, v in info.items():
                 k = k.startswith('/') and k[1:] or k
@@ -125,10 +140,11 @@ class Source(AbstractSource):
                     name, column_type=column_type, **col)
         else:
             columns = {}
-            for p in list(sub.glob('**/*.[pP][dD][fF]')):
-                with open(p.as_posix(), 'rb') as f:
+            for p in list(iter_documents(sub)):
+                with open_buffer(p) as buf:
                     try:
-                        info = PyPDF2.PdfFileReader(f).getDocumentInfo()
+                        info = PyPDF2.PdfFileReader(
+                            as_stream(buf)).getDocumentInfo()
                     except PyPDF2.utils.PdfReadError:
                         continue
                     # else
@@ -158,6 +174,10 @@ class Source(AbstractSource):
         raise NotImplementedError()
 
 
+def digest_record(record):
+    return record.get('md5') or digest_binary(record['raw'].encode('utf-8'))
+
+
 class IndexProfile(AbstractIndexProfile):
 
     def __init__(self, name, resource):
@@ -167,31 +187,24 @@ class IndexProfile(AbstractIndexProfile):
 
         @wraps(fun)
         def wrapper(self, *args, **kwargs):
+            # The digest of the file is kept, whatever the fingerprint
+            transformer = self.compile_transformer(
+                properties='properties', digest=digest_record,
+                fingerprint=False,
+                ignore=[p.name for p in self.iter_properties()
+                        if p.name.startswith('attachment')],
+                lineage={
+                    'resource': {
+                        'name': self.resource.name},
+                    'source': {
+                        'protocol': self.resource.source.protocol,
+                        'uri': self.resource.source.uri}})
             for record in fun(self, *args, **kwargs):
-
-                properties, _backuped = {}, {}
-                for k, v in record['properties'].items():
-                    prop = self.get_property(k)
-                    if prop:
-                        if prop.name.startswith('attachment'):
-                            continue
-                        if prop.rejected:
-                            _backuped[prop.name] = v
-                        else:
-                            properties[prop.alias or prop.name] = v
-
-                yield {
-                    '_backup': _backuped,
-                    '_md5': digest_binary(record['raw'].encode('utf-8')),
-                    'lineage': {
-                        'filename': record['filename'],
-                        'resource': {
-                            'name': self.resource.name},
-                        'source': {
-                            'protocol': self.resource.source.protocol,
-                            'uri': self.resource.source.uri}},
-                    'properties': properties,
-                    '_raw': record['raw']}
+                document = transformer(record)
+                document['lineage'] = dict(
+                    transformer.lineage, filename=record['filename'])
+                document['_raw'] = record['raw']
+                yield document
 
         return wrapper
 
@@ -14,49 +14,80 @@
 # under the License.
 
 
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from functools import wraps
+import io
+import itertools
+from onegeo_manager.cache import CacheEntry
+from onegeo_manager.cache import get_default_cache
+from onegeo_manager.codec import loads_response
 from onegeo_manager.exception import DuplicateColumnError
 from onegeo_manager.exception import NotYetImplemented
 from onegeo_manager.exception import OGCExceptionReport
 from onegeo_manager.exception import UnexpectedError
+from onegeo_manager import gml
 from onegeo_manager.index_profile import AbstractIndexProfile
 from onegeo_manager.index_profile import fetch_mapping
+from onegeo_manager.index_profile import format_collection
 from onegeo_manager.index_profile import not_searchable
 from onegeo_manager.resource import AbstractResource
 from onegeo_manager.source import AbstractSource
+from onegeo_manager.source import AsyncSourceMixin
+from onegeo_manager.transport import Transport
 from onegeo_manager.utils import browse
 from onegeo_manager.utils import clean_my_obj
 from onegeo_manager.utils import digest_object
 from onegeo_manager.utils import StaticClass
 import operator
 import re
-import requests
+from xml.sax.saxutils import escape
 import xmltodict
 
 
 __description__ = 'OGC:WFS'
 
 
+JSON_FORMAT = (
+    r'(((text|application)\/)?json\;?\s?'
+    r'((\w+=[^,;]+|(subtype\=geojson))\;?\s?)*)')
+
+GML_FORMATS = (  # Ordered by preference
+    r'^application\/gml\+xml;\s?version="?3\.2',
+    r'^text\/xml;\s?subtype="?gml\/3\.2',
+    r'^gml32$',
+    r'^text\/xml;\s?subtype="?gml\/3\.1',
+    r'^(gml3|GML3)$',
+    r'^text\/xml;\s?subtype="?gml\/2',
+    r'^(gml2|GML2)$')
+
+
+def convert_response(response):
+    if not isinstance(response, str):
+        return response
+    data = xmltodict.parse(response, process_namespaces=False)
+
+    if 'ExceptionReport' in data:
+        report = data['ExceptionReport']
+        if report['@version'] == '2.0.0':
+            code = report['Exception']['@exceptionCode']
+        else:
+            code = report['Exception']['@exceptionCode']
+
+        raise OGCExceptionReport(
+            code, report['Exception']['ExceptionText'])
+
+    return data
+
+
 def response_converter(fun):
 
     @wraps(fun)
     def wrapper(*args, **kwargs):
-        response = fun(*args, **kwargs)
-        if not isinstance(response, str):
-            return response
-        data = xmltodict.parse(response, process_namespaces=False)
-
-        if 'ExceptionReport' in data:
-            report = data['ExceptionReport']
-            if report['@version'] == '2.0.0':
-                code = report['Exception']['@exceptionCode']
-            else:
-                code = report['Exception']['@exceptionCode']
-
-            raise OGCExceptionReport(
-                code, report['Exception']['ExceptionText'])
-
-        return data
+        return convert_response(fun(*args, **kwargs))
     return wrapper
 
 
@@ -73,7 +104,7 @@ class Method(metaclass=StaticClass):
         return val in self.VERSION
 
     @staticmethod
-    def get(self, request_name, url, params=None, auth=None):
+    def prepare(self, request_name, params):
         params.update({'service': self.SERVICE})
 
         if self.authorized_requests(self, request_name):
@@ -86,30 +117,41 @@ class Method(metaclass=StaticClass):
                 self, params['version']):
             raise UnexpectedError(
                 'Version value \'{0}\' not authorized.'.format(params['version']))
+        return params
 
-        for i in range(0, 10):
-            try:
-                r = requests.get(url, params=params, auth=auth)
-            except Exception as e:
-                error = e
-                continue
-            else:
-                break
-        else:
-            raise error
+    @staticmethod
+    def request(self, request_name, url, params=None, auth=None,
+                stream=False, headers=None):
+        self.prepare(self, request_name, params)
+
+        r = Transport().get(
+            url, params=params, auth=auth, stream=stream, headers=headers)
 
-        if r.status_code == 200:
+        # OGC exception reports may come with a 4xx status
+        if r.status_code >= 500 or r.status_code == 429:
             r.raise_for_status()
+        return r
 
+    @staticmethod
+    def read(r, stream=False):
         pattern = '^(text|application)\/((\w+)\+?)+\;?((\s?\w+\=[\w\d\D]+);?)*$'
         s = re.search(pattern, r.headers['Content-Type'])
         if s and s.group(2) == 'json':
-            return r.json()
+            return loads_response(r)
+        elif s and s.group(2) == 'xml' and stream:
+            r.raw.decode_content = True
+            return r
         elif s and s.group(2) == 'xml':
             return r.text
         else:
             raise Exception('Error service response.', r.text)
 
+    @staticmethod
+    def get(self, request_name, url, params=None, auth=None, stream=False):
+        r = self.request(
+            self, request_name, url, params=params, auth=auth, stream=stream)
+        return self.read(r, stream=stream)
+
     @classmethod
     def get_capabilities(cls, url, params, auth=None):
         return cls.get(cls, 'GetCapabilities', url, params=params, auth=auth)
@@ -120,8 +162,199 @@ class Method(metaclass=StaticClass):
             cls.get(cls, 'DescribeFeatureType', url, params=params, auth=auth)
 
     @classmethod
-    def get_feature(cls, url, params, auth=None):
-        return cls.get(cls, 'GetFeature', url, params=params, auth=auth)
+    def get_feature(cls, url, params, auth=None, stream=False):
+        return cls.get(
+            cls, 'GetFeature', url, params=params, auth=auth, stream=stream)
+
+
+def local_key(key):
+    return key.split(':')[-1]
+
+
+def as_list(val):
+    if val is None:
+        return []
+    return isinstance(val, list) and val or [val]
+
+
+def localized(obj):
+    """Return a copy of a xmltodict mapping without namespace prefixes."""
+    if not isinstance(obj, dict):
+        return {}
+    return dict((local_key(k), v) for k, v in obj.items())
+
+
+def text(val):
+    if isinstance(val, dict):
+        return val.get('#text')
+    return val
+
+
+def split_bbox(bbox):
+    """Split a (minx, miny, maxx, maxy) box in four."""
+    minx, miny, maxx, maxy = bbox
+    x, y = (minx + maxx) / 2, (miny + maxy) / 2
+    return [(minx, miny, x, y), (x, miny, maxx, y),
+            (minx, y, x, maxy), (x, y, maxx, maxy)]
+
+
+FES = {  # Prefix, namespace, property reference element, GML namespace
+    '1.1.0': ('ogc', 'http://www.opengis.net/ogc', 'PropertyName',
+              'http://www.opengis.net/gml'),
+    '2.0.0': ('fes', 'http://www.opengis.net/fes/2.0', 'ValueReference',
+              'http://www.opengis.net/gml/3.2')}
+
+
+def literal(value):
+    return escape(
+        hasattr(value, 'isoformat') and value.isoformat() or str(value))
+
+
+class Filter(object):
+    """OGC Filter Encoding of the GetFeature FILTER parameter.
+
+    Filter Encoding 1.1 is used for WFS 1.1.0, FES 2.0 for WFS 2.0.0.
+    Predicates are combined with `And`.
+    """
+
+    def __init__(self, version, predicates=()):
+        self.version = version
+        self.prefix, self.namespace, self.reference, self.gml = FES[version]
+        self.predicates = tuple(predicates)
+
+    def property_is_greater_than(self, name, value):
+        return Filter(self.version, self.predicates + (
+            '<{0}:PropertyIsGreaterThan>'
+            '<{0}:{1}>{2}</{0}:{1}><{0}:Literal>{3}</{0}:Literal>'
+            '</{0}:PropertyIsGreaterThan>'.format(
+                self.prefix, self.reference, escape(name), literal(value)),))
+
+    def bbox(self, bbox, srsname):
+        minx, miny, maxx, maxy = bbox
+        # Axis order of 'urn:ogc:def:crs:EPSG::4326' is lat/lon
+        return Filter(self.version, self.predicates + (
+            '<{0}:BBOX><gml:Envelope srsName="{1}">'
+            '<gml:lowerCorner>{2} {3}</gml:lowerCorner>'
+            '<gml:upperCorner>{4} {5}</gml:upperCorner>'
+            '</gml:Envelope></{0}:BBOX>'.format(
+                self.prefix, escape(srsname), miny, minx, maxy, maxx),))
+
+    def __str__(self):
+        body = ''.join(self.predicates)
+        if len(self.predicates) > 1:
+            body = '<{0}:And>{1}</{0}:And>'.format(self.prefix, body)
+        return (
+            '<{0}:Filter xmlns:{0}="{1}" xmlns:gml="{2}">{3}</{0}:Filter>'
+            ).format(self.prefix, self.namespace, self.gml, body)
+
+
+class FeatureType(object):
+
+    def __init__(self, meta):
+        self.meta = meta
+
+        m = localized(meta)
+        self.name = text(m.get('Name'))
+        self.local_name = local_key(self.name)
+        self.title = text(m.get('Title'))
+        self.abstract = text(m.get('Abstract'))
+
+        self.default_crs = text(m.get('DefaultCRS') or m.get('DefaultSRS'))
+        self.other_crs = [text(v) for v in as_list(
+            m.get('OtherCRS') or m.get('OtherSRS'))]
+        self.crs = list(filter(None, [self.default_crs] + self.other_crs))
+
+        self.output_formats = [text(v) for v in as_list(
+            localized(m.get('OutputFormats')).get('Format'))]
+
+        self.wgs84_bbox = None
+        bbox = localized(m.get('WGS84BoundingBox'))
+        if bbox.get('LowerCorner') and bbox.get('UpperCorner'):
+            self.wgs84_bbox = tuple(
+                float(v) for v in '{0} {1}'.format(
+                    text(bbox['LowerCorner']),
+                    text(bbox['UpperCorner'])).split())
+
+
+class Capabilities(object):
+    """WFS capabilities parsed once, with dict indexes for every lookup."""
+
+    def __init__(self, data):
+        self.data = data
+        self.version = data.get('@version')
+
+        c = localized(data)
+
+        self.feature_types = [
+            FeatureType(f) for f in
+            as_list(localized(c.get('FeatureTypeList')).get('FeatureType'))]
+
+        self._by_name = {}
+        for f in self.feature_types:
+            # Qualified names win over local names
+            self._by_name.setdefault(f.local_name, f)
+        for f in self.feature_types:
+            self._by_name[f.name] = f
+
+        self.operations = {}
+        self.constraints = {}
+        meta = localized(c.get('OperationsMetadata'))
+        for op in as_list(meta.get('Operation')):
+            op = localized(op)
+            self.operations[op.get('@name')] = {
+                'parameters': self._parameters(op),
+                'constraints': self._constraints(op)}
+        self.parameters = self._parameters(meta)
+        self.constraints = self._constraints(meta)
+
+        self._output_formats = {}
+        for f in self.feature_types:
+            self._output_formats[f.name] = \
+                f.output_formats or self.operation_parameter(
+                    'GetFeature', 'outputFormat') or self.parameters.get(
+                        'outputFormat', [])
+
+    @staticmethod
+    def _values(elt):
+        elt = localized(elt)
+        values = elt.get('Value') or \
+            localized(elt.get('AllowedValues')).get('Value')
+        return [text(v) for v in as_list(values)]
+
+    @classmethod
+    def _parameters(cls, elt):
+        return dict(
+            (p.get('@name'), cls._values(p))
+            for p in as_list(localized(elt).get('Parameter')))
+
+    @classmethod
+    def _constraints(cls, elt):
+        constraints = {}
+        for p in as_list(localized(elt).get('Constraint')):
+            default = localized(p).get('DefaultValue')
+            constraints[p.get('@name')] = \
+                default is not None and text(default) or cls._values(p)
+        return constraints
+
+    def get_feature_type(self, name):
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise ValueError('{0} not found.'.format(name))
+
+    def output_formats(self, name):
+        return self._output_formats[self.get_feature_type(name).name]
+
+    def operation_parameter(self, operation, name):
+        op = self.operations.get(operation)
+        return op and op['parameters'].get(name) or \
+            self.parameters.get(name) or []
+
+    def constraint(self, name, operation=None):
+        op = self.operations.get(operation)
+        if op and name in op['constraints']:
+            return op['constraints'][name]
+        return self.constraints.get(name)
 
 
 class Resource(AbstractResource):
@@ -186,35 +419,43 @@ class Resource(AbstractResource):
 
 class Source(AbstractSource):
 
-    def __init__(self, url, username=None, password=None):
+    def __init__(self, url, username=None, password=None, cache=None):
         super().__init__(url)
 
         self.username = username
         self.password = password
+        self.cache = get_default_cache() if cache is None else cache or None
+
+        self._set_capabilities(self.__get_capabilities())
 
-        self.capabilities = browse(self.__get_capabilities(), '(wfs:)?WFS_Capabilities')
+    def _set_capabilities(self, data):
+        self.capabilities = browse(data, '(wfs:)?WFS_Capabilities')
+        self.model = Capabilities(self.capabilities)
+        self._outputformats = {}
 
-        _service_ident = browse(self.capabilities, '(ows:)?ServiceIdentification')
+        _service_ident = browse(
+            self.capabilities, '(ows:)?ServiceIdentification')
         self.title = browse(_service_ident, '(ows:)?Title')
         self.abstract = browse(_service_ident, '(ows:)?Abstract')
 
         self.metadata_url = ''
 
     def _retreive_ft_meta(self, ft_name):
-        for f in iter(self.capabilities['FeatureTypeList']['FeatureType']):
-            if f['Name'].split(':')[-1] == ft_name:
-                return f
-        raise ValueError('{0} not found.'.format(ft_name))
+        return self.model.get_feature_type(ft_name).meta
 
     def get_resources(self, *args, **kwargs):
         names = kwargs.pop('names', [])
 
         desc = self.__describe_feature_type(
-            version=self.capabilities['@version'],
+            version=self.model.version,
             typename=','.join(names) or None)
+        return self._read_resources(desc)
 
+    def _read_resources(self, desc):
         sch_elts = browse(desc, '(xsd:)?schema', '(xsd:)?element')
-        sch_cplx_types = browse(desc, '(xsd:)?schema', '(xsd:)?complexType')
+        sch_cplx_types = dict(
+            (m['@name'], m) for m in as_list(
+                browse(desc, '(xsd:)?schema', '(xsd:)?complexType')))
 
         resources = []
         for sch_elt in iter([
@@ -228,15 +469,7 @@ class Source(AbstractSource):
                 # TODO log this
                 continue
 
-            ct = None
-            for cplx_type in iter(
-                    isinstance(sch_cplx_types, list)
-                    and sch_cplx_types or [sch_cplx_types]):
-
-                if cplx_type['@name'] == sch_elt[1]:
-                    ct = cplx_type
-                    break
-
+            ct = sch_cplx_types.get(sch_elt[1])
             seq_elt = browse(
                 ct, '(xsd:)?complexContent',
                 '(xsd:)?extension', '(xsd:)?sequence', '(xsd:)?element')
@@ -253,61 +486,321 @@ class Source(AbstractSource):
             resources.append(resource)
         return resources
 
-    def get_collection(self, resource_name, step=500):
+    def get_collection(self, resource_name, step=500, prefetch=None,
+                       checkpoint=None, tiled=None, max_features=None,
+                       since=None, by_page=False):
+        """Yield the features of a resource.
+
+        `since` is a `checkpoint.Watermark`: only the features whose
+        property is greater than the watermark are requested, and the
+        watermark is updated once the harvest is complete.
+
+        If `by_page` is true, the features are yielded by lists, one per
+        page (or tile) returned by the server.
+        """
+        feature_type, params, tiled = \
+            self._collection_params(resource_name, tiled, since=since)
+
+        if tiled:
+            if checkpoint:
+                raise NotYetImplemented(
+                    'Checkpoints are not supported by the tiled strategy.')
+            pages = self._tiled_pages(
+                params, feature_type, max_features, step,
+                workers=prefetch or 1)
+        else:
+            params.update({'count': step, 'typenames': resource_name})
+            params['startindex'] = checkpoint and self._resume(
+                checkpoint, resource_name, params) or 0
+
+            if prefetch and prefetch > 1:
+                pages = self._prefetch_pages(
+                    params, step, prefetch, checkpoint=checkpoint)
+            else:
+                pages = self._paged_pages(
+                    params, step, checkpoint=checkpoint)
+
+        if since:
+            pages = since.track(pages, by_page=True)
+        if by_page:
+            yield from pages
+        else:
+            for page in pages:
+                yield from page
+
+    def _resume(self, checkpoint, resource_name, params):
+        """Bind `checkpoint` and return the index to resume from."""
+        cursor = checkpoint.bind(self.uri, resource_name, params)
+        if cursor:
+            before = list(self._get_page(
+                dict(params, count=1, startindex=cursor - 1)))
+            cursor = checkpoint.check(before[0] if before else None)
+        return cursor
+
+    def _paged_pages(self, params, step, checkpoint=None):
+        while True:
+            data = list(self._get_page(params))
+            if data:
+                yield data
+            if checkpoint and data:
+                checkpoint.commit(params['startindex'] + len(data), data[-1])
+            if len(data) < step:
+                break
+            params['startindex'] += step
+
+        checkpoint and checkpoint.done()
 
-        capacity = self._retreive_ft_meta(resource_name)
+    def _collection_params(self, resource_name, tiled=None, since=None):
+        """Return the feature type, the GetFeature parameters and the
+        harvesting strategy (tiled or paged) of a resource."""
+        feature_type = self.model.get_feature_type(resource_name)
 
-        params = {'version': self.capabilities['@version']}
+        params = {'version': self.model.version}
 
-        if params['version'] != '2.0.0':
+        if params['version'] not in Method.VERSION:
             raise UnexpectedError(
                 'Version {0} not implemented.'.format(params['version']))
 
-        try:
-            outputformats = ', '.join(capacity['OutputFormats']['Format'])
-        except KeyError:
-            for op in browse(self.capabilities, '(ows:)?OperationsMetadata', '(ows:)?Operation'):
-                if op['@name'] == 'GetFeature':
-                    for p in browse(op, '(ows:)?Parameter'):
-                        if p['@name'] == 'outputFormat':
-                            outputformats = ', '.join(
-                                browse(p, '(ows:)?AllowedValues', '(ows:)?Value'))
-                            break
-        regex = '(((text|application)\/)?json\;?\s?((\w+=[^,;]+|(subtype\=geojson))\;?\s?)*)'
-        s = re.search(regex, outputformats)
-        if not s:
-            raise NotYetImplemented('GeoJSON is mandatory.')
-        params['outputformat'] = s.group(0)
+        paging = params['version'] == '2.0.0' and str(self.model.constraint(
+            'ImplementsResultPaging', 'GetFeature')).upper() != 'FALSE'
+        if tiled is None:
+            tiled = not paging
+
+        if feature_type.name not in self._outputformats:
+            self._outputformats[feature_type.name] = self._select_outputformat(
+                self.model.output_formats(feature_type.name))
+        params['outputformat'] = self._outputformats[feature_type.name]
 
         ## TODO
-        # other_crs = capacity.get('OtherCRS', [])
-        # crs_str = ', '.join(
-        #     operator.add(
-        #         isinstance(other_crs, str) and [other_crs] or other_crs,
-        #         [capacity['DefaultCRS']]))
-        #
-        # s = re.search('((^|((\w*\:+)+))4326)', crs_str)
+        # s = re.search('((^|((\w*\:+)+))4326)', ', '.join(feature_type.crs))
         # if not s:
         #     raise UnexpectedError('')
         # params['srsname'] = s.group(0)
         params['srsname'] = 'urn:ogc:def:crs:EPSG::4326'
         ##
 
-        params.update(
-            {'startindex': 0, 'count': step, 'typenames': resource_name})
+        if tiled:
+            if params['version'] == '2.0.0':
+                params['typenames'] = resource_name
+            else:
+                params['typename'] = resource_name
 
-        while True:
-            data = self.__get_feature(**params)['features']
-            yield from data
-            if len(data) < step:
-                break
-            params['startindex'] += step
+        value = since and since.bind(self.uri, resource_name)
+        if value is not None:
+            fes = Filter(params['version']).property_is_greater_than(
+                since.property, value)
+            # Tiles add their BBOX to the filter, see `_tile_params`
+            params['filter'] = tiled and fes or str(fes)
+
+        return feature_type, params, tiled
+
+    @staticmethod
+    def _select_outputformat(outputformats):
+        """Return the GeoJSON output format, or the best GML one."""
+        s = re.search(JSON_FORMAT, ', '.join(outputformats))
+        if s:
+            return s.group(0)
+        for regex in GML_FORMATS:
+            for outputformat in outputformats:
+                if re.match(regex, outputformat):
+                    return outputformat
+        raise NotYetImplemented('Neither GeoJSON nor GML output is offered.')
+
+    def _get_page(self, params):
+        if re.search(JSON_FORMAT, params['outputformat']):
+            return self.__get_feature(**params)['features']
+        return self.__iter_gml_features(**params)
+
+    @staticmethod
+    def _hits_params(params):
+        ignored = ('count', 'maxfeatures', 'outputformat', 'startindex')
+        hits = dict((k, v) for k, v in params.items() if k not in ignored)
+        hits['resulttype'] = 'hits'
+        return hits
+
+    def _number_matched(self, params):
+        try:
+            data = self.__get_feature(**self._hits_params(params))
+        except OGCExceptionReport:
+            return None
+        return self._read_number_matched(data)
+
+    @staticmethod
+    def _read_number_matched(data):
+        if 'numberMatched' in data:  # JSON response
+            val = data['numberMatched']
+        else:
+            collection = browse(data, '(wfs:)?FeatureCollection')
+            val = browse(collection, '@numberMatched')
+            if val is None:  # WFS 1.1.0
+                val = browse(collection, '@numberOfFeatures')
+        try:
+            return int(val)
+        except (TypeError, ValueError):  # 'unknown'
+            return None
+
+    def _prefetch_pages(self, params, step, workers, checkpoint=None):
+        """Fetch `workers` pages at once and yield them in order.
+
+        Every `startindex` window is planned from the `numberMatched`
+        value returned by a `resultType=hits` request. When the server
+        does not know it, windows are requested speculatively until a
+        page shorter than `step` is returned.
+        """
+        total = self._number_matched(params)
+        start = params['startindex']
+        if total is None:
+            windows = itertools.count(start, step)
+        else:
+            windows = iter(range(start, total, step))
+
+        def fetch(startindex):
+            return list(self._get_page(dict(params, startindex=startindex)))
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for startindex in itertools.islice(windows, workers):
+                    pending.append(
+                        (startindex, executor.submit(fetch, startindex)))
+                while pending:
+                    startindex, future = pending.popleft()
+                    data = future.result()
+                    if data:
+                        yield data
+                    if checkpoint and data:
+                        checkpoint.commit(startindex + len(data), data[-1])
+                    if total is None and len(data) < step:
+                        break
+                    for startindex in itertools.islice(windows, 1):
+                        pending.append(
+                            (startindex, executor.submit(fetch, startindex)))
+            finally:
+                for startindex, future in pending:
+                    future.cancel()
+
+        checkpoint and checkpoint.done()
+
+    def _tiled_pages(self, params, feature_type, max_features, step,
+                     workers=1, max_depth=16):
+        """Harvest a feature type tile by tile.
+
+        This is meant for servers without paging support. The
+        `WGS84BoundingBox` of the feature type is fetched in `workers`
+        parallel requests; every tile returning `max_features` features
+        (the server cap) is split in four and fetched again. Features
+        found in several tiles are yielded once, by id or by digest, in
+        one list per tile. Tiles are not yielded in server order.
+
+        When neither `max_features` nor the `CountDefault` of the server
+        is known, `step` features are requested per tile and every tile
+        returning less is checked against the number of features it
+        matches (`resultType=hits`): a tile truncated by a lower cap is
+        split, and that cap is used from then on. Tiles are not checked
+        if the server does not give the number of features matched.
+        """
+        cap, known = self._tile_cap(params, feature_type, max_features, step)
+
+        def fetch(bbox):
+            tile_params = self._tile_params(params, bbox)
+            data = list(self._get_page(tile_params))
+            matched = None
+            if not known and len(data) < cap:
+                matched = self._number_matched(tile_params)
+            return data, matched
+
+        seen = set()
+        pending = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                bbox = feature_type.wgs84_bbox
+                tiles = workers > 1 and split_bbox(bbox) or [bbox]
+                for tile in tiles:
+                    pending[executor.submit(fetch, tile)] = (tile, 0)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        tile, depth = pending.pop(future)
+                        data, matched = future.result()
+                        if matched is not None and matched > len(data):
+                            cap, known = max(len(data), 1), True
+                        if len(data) >= cap:
+                            if depth >= max_depth:
+                                raise UnexpectedError(
+                                    'Tile {0} still holds {1} features or '
+                                    'more at depth {2}.'.format(
+                                        tile, cap, depth))
+                            for sub in split_bbox(tile):
+                                pending[executor.submit(fetch, sub)] = \
+                                    (sub, depth + 1)
+                            continue
+                        page = self._unseen(data, seen)
+                        if page:
+                            yield page
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    @staticmethod
+    def _unseen(features, seen):
+        """Return the features whose id (or digest) is not in `seen`."""
+        page = []
+        for feature in features:
+            key = feature.get('id') or digest_object(feature)
+            if key not in seen:
+                seen.add(key)
+                page.append(feature)
+        return page
+
+    def _tile_cap(self, params, feature_type, max_features, step):
+        """Set the number of features requested per tile and return it,
+        along with whether it is the cap of the server."""
+        if not feature_type.wgs84_bbox:
+            raise UnexpectedError(
+                "No WGS84BoundingBox found for '{0}'.".format(
+                    feature_type.name))
+
+        cap, known = max_features or step, max_features is not None
+        count_default = self.model.constraint('CountDefault', 'GetFeature')
+        if count_default and str(count_default).isdigit():
+            cap, known = min(cap, int(count_default)), True
+        if params['version'] == '2.0.0':
+            params['count'] = cap
+        else:
+            params['maxfeatures'] = cap
+        return cap, known
+
+    @staticmethod
+    def _tile_params(params, bbox):
+        if 'filter' in params:
+            # BBOX and FILTER parameters are mutually exclusive
+            return dict(params, filter=str(
+                params['filter'].bbox(bbox, params['srsname'])))
+        minx, miny, maxx, maxy = bbox
+        # Axis order of 'urn:ogc:def:crs:EPSG::4326' is lat/lon
+        return dict(params, bbox='{0},{1},{2},{3},{4}'.format(
+            miny, minx, maxy, maxx, params['srsname']))
 
-    @response_converter
     def __get_capabilities(self, **params):
         auth = self.username and self.password \
             and (self.username, self.password) or None
-        return Method.get_capabilities(self.uri, params, auth=auth)
+
+        if not self.cache:
+            return convert_response(
+                Method.get_capabilities(self.uri, params, auth=auth))
+
+        def load(headers):
+            r = Method.request(
+                Method, 'GetCapabilities', self.uri, params=dict(params),
+                auth=auth, headers=headers)
+            if r.status_code == 304:
+                return None
+            return CacheEntry.from_response(
+                convert_response(Method.read(r)), r)
+
+        key = self.cache.key(
+            self.uri, params.get('version'), self.username, self.password)
+        return self.cache.fetch(key, load)
 
     @response_converter
     def __describe_feature_type(self, **params):
@@ -321,9 +814,218 @@ class Source(AbstractSource):
             and (self.username, self.password) or None
         return Method.get_feature(self.uri, params, auth=auth)
 
+    def __iter_gml_features(self, **params):
+        auth = self.username and self.password \
+            and (self.username, self.password) or None
+        r = Method.get_feature(self.uri, params, auth=auth, stream=True)
+        if not hasattr(r, 'raw'):
+            raise UnexpectedError('Error service response.', r)
+        try:
+            yield from gml.iter_features(r.raw, srs_name=params.get('srsname'))
+        finally:
+            r.close()
+
+
+class AsyncSource(AsyncSourceMixin, Source):
+    """asyncio counterpart of `Source`.
+
+    The capabilities are loaded when entering the async context.
+    """
+
+    def __init__(self, url, username=None, password=None, cache=None,
+                 transport=None):
+        AbstractSource.__init__(self, url)
+
+        self.username = username
+        self.password = password
+        self.cache = get_default_cache() if cache is None else cache or None
+
+        self._init_transport(transport)
+
+    async def _open(self):
+        self._set_capabilities(await self._get_capabilities())
+
+    async def _request(self, request_name, params, headers=None):
+        auth = self.username and self.password \
+            and (self.username, self.password) or None
+        r = await self.transport.get(
+            self.uri,
+            params=Method.prepare(Method, request_name, dict(params)),
+            auth=auth, headers=headers)
+
+        # OGC exception reports may come with a 4xx status
+        if r.status_code >= 500 or r.status_code == 429:
+            r.raise_for_status()
+        return r
+
+    async def _get_capabilities(self, **params):
+        if not self.cache:
+            return convert_response(
+                Method.read(await self._request('GetCapabilities', params)))
+
+        async def load(headers):
+            r = await self._request('GetCapabilities', params, headers=headers)
+            if r.status_code == 304:
+                return None
+            return CacheEntry.from_response(
+                convert_response(Method.read(r)), r)
+
+        key = self.cache.key(
+            self.uri, params.get('version'), self.username, self.password)
+        return await self.cache.afetch(key, load)
+
+    async def get_resources(self, *args, **kwargs):
+        names = kwargs.pop('names', [])
+
+        r = await self._request('DescribeFeatureType', {
+            'version': self.model.version,
+            'typename': ','.join(names) or None})
+        return self._read_resources(convert_response(Method.read(r)))
+
+    async def get_collection(self, resource_name, step=500, prefetch=None,
+                             checkpoint=None, tiled=None, max_features=None,
+                             since=None, by_page=False):
+
+        feature_type, params, tiled = \
+            self._collection_params(resource_name, tiled, since=since)
+
+        if tiled:
+            if checkpoint:
+                raise NotYetImplemented(
+                    'Checkpoints are not supported by the tiled strategy.')
+            pages = self._tiled_pages(
+                params, feature_type, max_features, step,
+                workers=prefetch or 1)
+        else:
+            params.update({'count': step, 'typenames': resource_name})
+            params['startindex'] = checkpoint and await self._resume(
+                checkpoint, resource_name, params) or 0
+
+            pages = self._prefetch_pages(
+                params, step, prefetch or 1, checkpoint=checkpoint)
+
+        if since:
+            pages = since.atrack(pages, by_page=True)
+        async for page in pages:
+            if by_page:
+                yield page
+            else:
+                for feature in page:
+                    yield feature
+
+    async def _resume(self, checkpoint, resource_name, params):
+        cursor = checkpoint.bind(self.uri, resource_name, params)
+        if cursor:
+            before = await self._get_page(
+                dict(params, count=1, startindex=cursor - 1))
+            cursor = checkpoint.check(before[0] if before else None)
+        return cursor
+
+    async def _get_page(self, params):
+        r = await self._request('GetFeature', params)
+        if re.search(JSON_FORMAT, params['outputformat']):
+            return convert_response(Method.read(r))['features']
+
+        # Parsing is CPU bound, keep the event loop free meanwhile
+        return await asyncio.get_event_loop().run_in_executor(
+            None, lambda: list(gml.iter_features(
+                io.BytesIO(r.content), srs_name=params.get('srsname'))))
+
+    async def _number_matched(self, params):
+        try:
+            data = convert_response(Method.read(
+                await self._request('GetFeature', self._hits_params(params))))
+        except OGCExceptionReport:
+            return None
+        return self._read_number_matched(data)
+
+    async def _prefetch_pages(self, params, step, workers, checkpoint=None):
+        """Keep `workers` pages in flight and yield them in order."""
+        total = None
+        if workers > 1:
+            total = await self._number_matched(params)
+        start = params['startindex']
+        if total is None:
+            windows = itertools.count(start, step)
+        else:
+            windows = iter(range(start, total, step))
+
+        def fetch(startindex):
+            return asyncio.ensure_future(
+                self._get_page(dict(params, startindex=startindex)))
+
+        pending = deque(
+            (startindex, fetch(startindex))
+            for startindex in itertools.islice(windows, workers))
+        try:
+            while pending:
+                startindex, task = pending.popleft()
+                data = await task
+                if data:
+                    yield data
+                if checkpoint and data:
+                    checkpoint.commit(startindex + len(data), data[-1])
+                if total is None and len(data) < step:
+                    break
+                for startindex in itertools.islice(windows, 1):
+                    pending.append((startindex, fetch(startindex)))
+        finally:
+            for startindex, task in pending:
+                task.cancel()
+
+        checkpoint and checkpoint.done()
+
+    async def _tiled_pages(self, params, feature_type, max_features, step,
+                           workers=1, max_depth=16):
+        """Coroutine counterpart of `Source._tiled_pages`."""
+        cap, known = self._tile_cap(params, feature_type, max_features, step)
+        semaphore = asyncio.Semaphore(workers)
+
+        async def fetch(bbox):
+            tile_params = self._tile_params(params, bbox)
+            async with semaphore:
+                data = await self._get_page(tile_params)
+                matched = None
+                if not known and len(data) < cap:
+                    matched = await self._number_matched(tile_params)
+            return data, matched
+
+        seen = set()
+        pending = {}
+        try:
+            bbox = feature_type.wgs84_bbox
+            tiles = workers > 1 and split_bbox(bbox) or [bbox]
+            for tile in tiles:
+                pending[asyncio.ensure_future(fetch(tile))] = (tile, 0)
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tile, depth = pending.pop(task)
+                    data, matched = task.result()
+                    if matched is not None and matched > len(data):
+                        cap, known = max(len(data), 1), True
+                    if len(data) >= cap:
+                        if depth >= max_depth:
+                            raise UnexpectedError(
+                                'Tile {0} still holds {1} features or '
+                                'more at depth {2}.'.format(tile, cap, depth))
+                        for sub in split_bbox(tile):
+                            pending[asyncio.ensure_future(fetch(sub))] = \
+                                (sub, depth + 1)
+                        continue
+                    page = self._unseen(data, seen)
+                    if page:
+                        yield page
+        finally:
+            for task in pending:
+                task.cancel()
+
 
 class IndexProfile(AbstractIndexProfile):
 
+    PAGED_COLLECTION = True
+
     def __init__(self, name, resource):
         super().__init__(name, resource)
 
@@ -331,28 +1033,18 @@ class IndexProfile(AbstractIndexProfile):
 
         @wraps(fun)
         def wrapper(self, *args, **kwargs):
-            for record in fun(self, *args, **kwargs):
-
-                properties, _backuped = {}, {}
-                for k, v in record['properties'].items():
-                    prop = self.get_property(k)
-                    if prop:
-                        if prop.rejected:
-                            _backuped[prop.name] = v
-                        else:
-                            properties[prop.alias or prop.name] = v
-
-                yield {
-                    '_backup': _backuped,
-                    '_md5': digest_object(record),
-                    'geometry': record.get('geometry'),
-                    'lineage': {
-                        'resource': {
-                            'name': self.resource.name},
-                        'source': {
-                            'protocol': self.resource.source.protocol,
-                            'uri': self.resource.source.uri}},
-                    'properties': properties}
+            transformer = self.compile_transformer(
+                properties='properties', digest=digest_object,
+                geometry='geometry',
+                lineage={
+                    'resource': {
+                        'name': self.resource.name},
+                    'source': {
+                        'protocol': self.resource.source.protocol,
+                        'uri': self.resource.source.uri}})
+            return format_collection(
+                transformer, fun(self, *args, **kwargs),
+                by_page=kwargs.get('by_page'))
 
         return wrapper
 
@@ -382,6 +1074,9 @@ class IndexProfile(AbstractIndexProfile):
         return clean_my_obj({
             self.name: {
                 'properties': {
+                    # Byte savings of the geometry reducer, not indexed
+                    '_geometry': self.geometry_reducer and {
+                        'type': 'object', 'enabled': False} or None,
                     'geometry': geometry_mapping,
                     'lineage': {
                         'properties': {
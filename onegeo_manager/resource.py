@@ -18,6 +18,7 @@ from abc import ABCMeta
 from importlib import import_module
 from onegeo_manager.exception import DuplicateColumnError
 from onegeo_manager.exception import ProtocolNotFoundError
+from onegeo_manager.source import AbstractSource
 import re
 
 
@@ -33,7 +34,7 @@ class AbstractResource(metaclass=ABCMeta):
 
     def __init__(self, source, name=None):
 
-        if not source.__class__.__qualname__ == 'Source':
+        if not isinstance(source, AbstractSource):
             raise TypeError("Argument should be an instance of 'Source'.")
 
         self._source = source
@@ -18,12 +18,14 @@ from abc import ABCMeta
 from abc import abstractmethod
 from importlib import import_module
 import inspect
+from onegeo_manager.exception import NotYetImplemented
 from onegeo_manager.exception import ProtocolNotFoundError
+from onegeo_manager.transport import AsyncTransport
 import os.path
 import re
 
 
-__all__ = ['Source']
+__all__ = ['AsyncSource', 'Source']
 
 
 class AbstractSource(metaclass=ABCMeta):
@@ -45,20 +47,71 @@ class AbstractSource(metaclass=ABCMeta):
     #         "This is an abstract method. You can't do anything with it.")
 
 
+class AsyncSourceMixin(object):
+    """Transport handling of the asyncio sources.
+
+    An `AsyncTransport` is created when entering the async context (and
+    closed on exit) unless one is given. `_open` is then awaited.
+    """
+
+    def _init_transport(self, transport=None):
+        self.transport = transport
+        self._own_transport = transport is None
+
+    async def _open(self):
+        pass
+
+    async def __aenter__(self):
+        if self.transport is None:
+            self.transport = AsyncTransport()
+        await self._open()
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._own_transport and self.transport is not None:
+            await self.transport.close()
+            self.transport = None
+
+
+def import_protocol(protocol):
+    try:
+        return import_module(
+            'onegeo_manager.protocol.{0}'.format(protocol), __name__)
+    except Exception as e:
+        if e.__class__.__qualname__ == 'ModuleNotFoundError' \
+                and re.search("No module named 'onegeo_manager.protocol.\w+'", e.msg):
+            raise ProtocolNotFoundError(
+                "No protocol named '{}'".format(protocol))
+        raise e
+
+
 class Source(object):
 
     def __new__(self, uri, protocol, **kwargs):
 
-        try:
-            ext = import_module(
-                'onegeo_manager.protocol.{0}'.format(protocol), __name__)
-        except Exception as e:
-            if e.__class__.__qualname__ == 'ModuleNotFoundError' \
-                    and re.search("No module named 'onegeo_manager.protocol.\w+'", e.msg):
-                raise ProtocolNotFoundError(
-                    "No protocol named '{}'".format(protocol))
-            raise e
+        ext = import_protocol(protocol)
 
         self = object.__new__(ext.Source)
         self.__init__(uri, **kwargs)
         return self
+
+
+class AsyncSource(object):
+    """asyncio counterpart of `Source`.
+
+    Use it as an async context manager, which loads the capabilities:
+
+        async with AsyncSource(uri, protocol) as src:
+            resources = await src.get_resources()
+    """
+
+    def __new__(self, uri, protocol, **kwargs):
+
+        ext = import_protocol(protocol)
+        if not hasattr(ext, 'AsyncSource'):
+            raise NotYetImplemented(
+                "No asyncio support for protocol '{}'".format(protocol))
+
+        self = object.__new__(ext.AsyncSource)
+        self.__init__(uri, **kwargs)
+        return self
@@ -0,0 +1,557 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import asyncio
+from email.utils import parsedate_to_datetime
+from onegeo_manager.codec import loads
+from onegeo_manager.exception import CircuitOpenError
+from onegeo_manager.fileio import guess_compression
+from onegeo_manager.utils import Singleton
+from queue import Empty
+from queue import Full
+from queue import Queue
+import random
+import re
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+COMPRESSION_CONTENT_TYPES = (
+    'application/gzip', 'application/octet-stream', 'application/x-bzip2',
+    'application/x-gzip', 'application/x-lzma', 'application/x-xz')
+
+PREFETCH_DEPTH = 16  # Number of chunks read ahead of the consumer
+
+
+def host_key(url):
+    """Return the 'host:port' string identifying the pool of an url."""
+    u = urlsplit(url)
+    return '{0}:{1}'.format(u.hostname, u.port or DEFAULT_PORTS.get(u.scheme))
+
+
+def parse_retry_after(val):
+    """Return the delay in seconds given by a Retry-After header."""
+    if not val:
+        return None
+    try:
+        return max(float(val), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(val).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def response_name(r):
+    """Return the path of the url of a response, to guess its compression."""
+    return urlsplit(r.url).path
+
+
+def is_compressed_response(r):
+    """Tell whether the body of a response is a compressed file."""
+    content_type = r.headers.get('Content-Type', '').split(';')[0].strip()
+    return content_type in COMPRESSION_CONTENT_TYPES \
+        or guess_compression(response_name(r)) is not None
+
+
+def iter_prefetched(chunks, depth=PREFETCH_DEPTH, close=None):
+    """Yield the items of `chunks` while a thread reads up to `depth` ahead.
+
+    The download of a streamed response thus goes on while the chunks
+    already received are parsed. `close` (the `close` method of the
+    response) is called by the thread once it stops reading, which is
+    never before this generator is closed or exhausted.
+    """
+    queue = Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)):
+                    return
+            put((end, None))
+        except Exception as e:
+            put((end, e))
+        finally:
+            close and close()
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                chunk, error = queue.get(timeout=0.1)
+            except Empty:
+                if not thread.is_alive() and queue.empty():
+                    raise RuntimeError(
+                        'The chunk reader stopped unexpectedly.')
+                continue
+            if chunk is end:
+                if error is not None:
+                    raise error
+                return
+            yield chunk
+    finally:
+        stop.set()
+
+
+class CircuitBreaker(object):
+    """Per-host circuit breaker.
+
+    The circuit opens after `threshold` consecutive failures. While it is
+    open calls fail fast; after `recovery_time` seconds one trial call is
+    let through (half-open) and closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, threshold=5, recovery_time=30):
+        self.threshold = threshold
+        self.recovery_time = recovery_time
+        self._failures = {}
+        self._opened = {}
+        self._trial = set()
+        self._lock = threading.Lock()
+
+    def before(self, host):
+        with self._lock:
+            opened = self._opened.get(host)
+            if opened is None:
+                return
+            if time.time() - opened < self.recovery_time \
+                    or host in self._trial:
+                raise CircuitOpenError(
+                    "Circuit open for '{0}'.".format(host))
+            self._trial.add(host)  # Half-open
+
+    def release(self, host):
+        """End a trial call that neither failed nor succeeded."""
+        with self._lock:
+            self._trial.discard(host)
+
+    def success(self, host):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened.pop(host, None)
+            self._trial.discard(host)
+
+    def failure(self, host):
+        """Record a failure and return True if the circuit has just opened."""
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if host in self._trial:
+                self._trial.discard(host)
+                self._opened[host] = time.time()
+                return True
+            if host not in self._opened \
+                    and self._failures[host] >= self.threshold:
+                self._opened[host] = time.time()
+                return True
+            return False
+
+    def open_circuits(self):
+        with self._lock:
+            return sorted(self._opened.keys())
+
+
+class RetryBudget(object):
+    """Per-host token bucket limiting the number of retries."""
+
+    def __init__(self, capacity=20, period=60):
+        self.capacity = capacity
+        self.period = period
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        with self._lock:
+            now = time.time()
+            tokens, last = self._tokens.get(host, (self.capacity, now))
+            tokens = min(
+                self.capacity,
+                tokens + (now - last) * self.capacity / self.period)
+            if tokens < 1:
+                self._tokens[host] = (tokens, now)
+                return False
+            self._tokens[host] = (tokens - 1, now)
+            return True
+
+
+class RetryPolicy(object):
+    """Retry with exponential backoff and full jitter.
+
+    `Retry-After` headers are honoured, retries are limited by a per-host
+    budget and a circuit breaker fails fast while an upstream is down.
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=30,
+                 budget=None, breaker=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self._metrics = {'retries': {}, 'failures': {}, 'circuit_opened': {}}
+        self._lock = threading.Lock()
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _count(self, name, host):
+        with self._lock:
+            self._metrics[name][host] = self._metrics[name].get(host, 0) + 1
+
+    def call(self, host, fun, exceptions=None, is_failure=None):
+        """Call `fun` until it succeeds or the policy gives up.
+
+        Exceptions of the `exceptions` types and results for which
+        `is_failure` returns True are retried. The last result is
+        returned (or the last exception raised) when the retries are
+        exhausted.
+        """
+        exceptions = exceptions or self.RETRY_EXCEPTIONS
+        attempt = 0
+        while True:
+            self.breaker.before(host)
+
+            error, result = None, None
+            try:
+                result = fun()
+            except exceptions as e:
+                error = e
+            except BaseException:
+                # Neither a failure nor a success of the host (a decoding
+                # error, a cancellation...), another trial may follow
+                self.breaker.release(host)
+                raise
+            else:
+                if not (is_failure and is_failure(result)):
+                    self.breaker.success(host)
+                    return result
+
+            delay = self._on_failure(host, attempt, result)
+            if delay is None:
+                if error:
+                    raise error
+                return result
+
+            hasattr(result, 'close') and result.close()
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, host, fun, exceptions=None, is_failure=None):
+        """Coroutine counterpart of `call`, `fun` returns an awaitable."""
+        exceptions = exceptions or self.RETRY_EXCEPTIONS
+        attempt = 0
+        while True:
+            self.breaker.before(host)
+
+            error, result = None, None
+            try:
+                result = await fun()
+            except exceptions as e:
+                error = e
+            except BaseException:
+                # Neither a failure nor a success of the host (a decoding
+                # error, a cancellation...), another trial may follow
+                self.breaker.release(host)
+                raise
+            else:
+                if not (is_failure and is_failure(result)):
+                    self.breaker.success(host)
+                    return result
+
+            delay = self._on_failure(host, attempt, result)
+            if delay is None:
+                if error:
+                    raise error
+                return result
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _on_failure(self, host, attempt, result=None):
+        """Record a failure and return the delay before the next attempt.
+
+        None is returned when the policy gives up.
+        """
+        self._count('failures', host)
+        if self.breaker.failure(host):
+            self._count('circuit_opened', host)
+
+        if attempt >= self.max_retries or not self.budget.acquire(host):
+            return None
+
+        self._count('retries', host)
+        return self.delay(attempt, parse_retry_after(
+            getattr(result, 'headers', {}).get('Retry-After')))
+
+    def is_failed_response(self, response):
+        return response.status_code in self.RETRY_STATUS
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict((k, dict(v)) for k, v in self._metrics.items())
+        metrics['open_circuits'] = self.breaker.open_circuits()
+        return metrics
+
+
+class Transport(metaclass=Singleton):
+    """Shared HTTP transport.
+
+    One `requests.Session` is kept for the whole process so that every
+    protocol module reuses the same per-host connection pools (keep-alive)
+    instead of opening a new TCP/TLS connection for each request.
+    """
+
+    POOL_CONNECTIONS = 10  # Number of host pools kept
+    POOL_MAXSIZE = 10  # Number of connections kept per host
+    TIMEOUT = (10, 300)  # (connect, read) in seconds
+    HEADERS = {
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._pool_connections = self.POOL_CONNECTIONS
+        self._pool_maxsize = self.POOL_MAXSIZE
+        self._timeout = self.TIMEOUT
+        self._headers = dict(self.HEADERS)
+        self._requests = {}
+        self._connections = {}
+        self.policy = RetryPolicy()
+        self.configure()
+
+    def configure(self, pool_connections=None, pool_maxsize=None,
+                  timeout=None, headers=None, policy=None):
+        """(Re)build the underlying session with the given settings."""
+        with self._lock:
+            if policy is not None:
+                self.policy = policy
+            if pool_connections is not None:
+                self._pool_connections = pool_connections
+            if pool_maxsize is not None:
+                self._pool_maxsize = pool_maxsize
+            if timeout is not None:
+                self._timeout = timeout
+            if headers is not None:
+                self._headers.update(headers)
+
+            if self._session:
+                self._collect()
+                self._session.close()
+
+            self._adapter = HTTPAdapter(
+                pool_connections=self._pool_connections,
+                pool_maxsize=self._pool_maxsize,
+                max_retries=0)
+
+            self._session = requests.Session()
+            self._session.mount('http://', self._adapter)
+            self._session.mount('https://', self._adapter)
+            self._session.headers.update(self._headers)
+
+    @property
+    def session(self):
+        return self._session
+
+    def get(self, url, params=None, auth=None, headers=None,
+            stream=False, timeout=None):
+        host = host_key(url)
+
+        def get():
+            with self._lock:
+                self._requests[host] = self._requests.get(host, 0) + 1
+            return self._session.get(
+                url, params=params, auth=auth, headers=headers,
+                stream=stream, timeout=timeout or self._timeout)
+
+        return self.policy.call(
+            host, get, is_failure=self.policy.is_failed_response)
+
+    def _iter_pools(self):
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                yield pool
+
+    def _collect(self):
+        # Keep track of the connections opened by a session before dropping it
+        for pool in self._iter_pools():
+            host = '{0}:{1}'.format(pool.host, pool.port)
+            self._connections[host] = \
+                self._connections.get(host, 0) + pool.num_connections
+
+    def stats(self):
+        """Return the connection-reuse statistics per host."""
+        with self._lock:
+            connections = dict(self._connections)
+            for pool in self._iter_pools():
+                host = '{0}:{1}'.format(pool.host, pool.port)
+                connections[host] = \
+                    connections.get(host, 0) + pool.num_connections
+
+            stats = {}
+            for host, count in self._requests.items():
+                opened = connections.get(host, 0)
+                stats[host] = {
+                    'requests': count,
+                    'connections': opened,
+                    'reused': max(count - opened, 0)}
+            return stats
+
+
+class AsyncResponse(object):
+    """Response of an `AsyncTransport` request.
+
+    The body of a streamed response is not read: it is available through
+    `iter_content` and the response must be closed.
+    """
+
+    def __init__(self, url, status_code, headers, content, raw=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.raw = raw
+
+    @property
+    def text(self):
+        s = re.search(
+            'charset=([\\w-]+)', self.headers.get('Content-Type', ''))
+        return self.content.decode(s and s.group(1) or 'utf-8')
+
+    def json(self):
+        return loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                '{0} Error for url: {1}'.format(self.status_code, self.url),
+                response=self)
+
+    async def iter_content(self, chunk_size=65536):
+        if self.raw is None:
+            for i in range(0, len(self.content), chunk_size):
+                yield self.content[i:i + chunk_size]
+            return
+        async for chunk in self.raw.content.iter_chunked(chunk_size):
+            yield chunk
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.release()
+            self.raw = None
+
+
+class AsyncTransport(object):
+    """asyncio counterpart of `Transport`, backed by aiohttp.
+
+    A transport holds its own connection pools and must be closed (or
+    used as an async context manager). The retry policy is shared with
+    the synchronous transport unless another one is given.
+    """
+
+    def __init__(self, pool_maxsize=None, timeout=None, headers=None,
+                 policy=None):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required by the asyncio API.')
+        self._pool_maxsize = pool_maxsize or Transport.POOL_MAXSIZE
+        self._timeout = timeout or Transport.TIMEOUT
+        self._headers = dict(Transport.HEADERS)
+        self._headers.update(headers or {})
+        self.policy = policy or Transport().policy
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            connect, read = self._timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self._pool_maxsize),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=connect, sock_read=read),
+                headers=self._headers)
+        return self._session
+
+    async def get(self, url, params=None, auth=None, headers=None,
+                  stream=False):
+        # aiohttp does not drop None parameters as requests does
+        params = params and dict(
+            (k, str(v)) for k, v in params.items() if v is not None)
+        auth = auth and aiohttp.BasicAuth(*auth) or None
+
+        async def get():
+            r = await self.session.get(
+                url, params=params, auth=auth, headers=headers)
+            response = AsyncResponse(
+                str(r.url), r.status, CaseInsensitiveDict(r.headers), None,
+                raw=r)
+            if stream and not self.policy.is_failed_response(response):
+                return response
+            try:
+                response.content = await r.read()
+            finally:
+                response.close()
+            return response
+
+        return await self.policy.acall(
+            host_key(url), get,
+            exceptions=(aiohttp.ClientError, asyncio.TimeoutError),
+            is_failure=self.policy.is_failed_response)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
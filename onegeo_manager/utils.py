@@ -15,9 +15,8 @@
 
 
 import hashlib
-from io import StringIO
 import itertools
-import json
+from onegeo_manager.codec import canonical
 # import math
 # import numpy as np
 import operator
@@ -43,8 +42,10 @@ def accumulate(obj):  # TODO: recursive
             yield occur, parent, children
 
 
-def iterate(obj, parent=None, path=list()):
+def iterate(obj, parent=None, path=None):
     """Iterate any obj and return value with his path."""
+    if path is None:
+        path = []
     parent and path.append(parent)
     if isinstance(obj, dict):
         for key, value in obj.items():
@@ -136,13 +137,11 @@ class Singleton(type):
 
 def digest_object(obj, encoding='utf-8'):
     """Convert any object to md5 hex digest through a ordonned and minified JSON data."""
-    io = StringIO()
-    json.dump(
-        obj, io, skipkeys=False, ensure_ascii=False,
-        check_circular=True, allow_nan=True, cls=None, indent=None,
-        separators=(',', ':'), default=None, sort_keys=True)
+    data = canonical(obj)
+    if encoding.lower() not in ('utf-8', 'utf8'):
+        data = data.decode('utf-8').encode(encoding)
 
-    return hashlib.md5(io.getvalue().encode(encoding)).hexdigest()
+    return hashlib.md5(data).hexdigest()
 
 
 def digest_binary(file):
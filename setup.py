@@ -46,4 +46,6 @@ setup(
         'Programming Language :: Python :: 3.6'],
     packages=find_packages(where='.'),
     install_requires=reqs,
+    extras_require={
+        'async': ['aiohttp>=3.5']},
     )
@@ -0,0 +1,174 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from onegeo_manager.bulk import batch_collection
+from onegeo_manager.bulk import BulkEncoder
+from onegeo_manager.checkpoint import Checkpoint
+from onegeo_manager.checkpoint import CheckpointStore
+import json
+from onegeo_manager.protocol import wfs
+import tempfile
+import unittest
+
+
+class CountingEncoder(BulkEncoder):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def encode(self, document):
+        self.calls += 1
+        return super().encode(document)
+
+
+def pages(sizes):
+    i = 0
+    for size in sizes:
+        yield [{'id': j, 'name': 'x' * 10} for j in range(i, i + size)]
+        i += size
+
+
+class BatchCollectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = CountingEncoder('idx', id='id')
+        self.size = len(b''.join(
+            self.encoder.encode({'id': 0, 'name': 'x' * 10})))
+        self.encoder.calls = 0
+
+    def test_documents(self):
+        batches = list(batch_collection(
+            iter(next(pages([5]))), self.encoder, max_docs=2))
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+        self.assertEqual(self.encoder.calls, 5)
+
+    def test_pages(self):
+        batches = list(batch_collection(
+            pages([3, 3, 3, 0, 2]), self.encoder, max_docs=7, pages=True))
+        self.assertEqual([len(b) for b in batches], [6, 5])
+        self.assertEqual(
+            [d['id'] for b in batches for d in b], list(range(11)))
+
+    def test_page_alignment(self):
+        # Pages of 3 documents larger than a batch are split, the next
+        # batch starts at the next page
+        batches = list(batch_collection(
+            pages([3, 3]), self.encoder, max_bytes=2 * self.size,
+            pages=True))
+        self.assertEqual([len(b) for b in batches], [2, 1, 2, 1])
+        self.assertTrue(all(b.size <= 2 * self.size for b in batches))
+
+    def test_bodies(self):
+        documents = list(next(pages([10])))
+        bodies = list(self.encoder.iter_requests(iter(documents)))
+        self.assertEqual(self.encoder.calls, 10)
+        lines = b''.join(bodies).splitlines()
+        self.assertEqual(len(lines), 20)
+        self.assertEqual(lines[0], b'{"index":{"_index":"idx","_id":"0"}}')
+
+    def test_raw(self):
+        encoder = BulkEncoder('idx', raw=('data',))
+        for data in ('aGVsbG8=', 'h\u00e9llo', 'a"b'):
+            with self.subTest(data=data):
+                document = {'data': data, 'name': 'x'}
+                body = b''.join(encoder.encode(document)).splitlines()[1]
+                self.assertEqual(json.loads(body.decode()), document)
+
+
+class PagedSource(object):
+    """WFS source serving `total` features (numbered from `first`),
+    failing at `fail` if given."""
+
+    uri = 'http://hostname/wfs'
+    _paged_pages = wfs.Source._paged_pages
+    _resume = wfs.Source._resume
+
+    def __init__(self, total, fail=None, first=0):
+        self.total = total
+        self.fail = fail
+        self.first = first
+
+    def _get_page(self, params):
+        start = params['startindex']
+        if start == self.fail:
+            raise ConnectionError()
+        return [{'id': self.first + i} for i in range(
+            start, min(start + params['count'], self.total))]
+
+
+class CheckpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = CheckpointStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def harvest(self, source, step=3, max_docs=6):
+        checkpoint = Checkpoint(self.store)
+        params = {'count': step}
+        params['startindex'] = source._resume(
+            checkpoint, 'road', params) or 0
+        pages = source._paged_pages(params, step, checkpoint=checkpoint)
+        return batch_collection(
+            pages, BulkEncoder('idx'), max_docs=max_docs, pages=True,
+            checkpoint=checkpoint)
+
+    def ids(self, batches):
+        return [d['id'] for b in batches for d in b]
+
+    def test_fail_before_first_batch(self):
+        # The first page is held by a batch which is never sent
+        batches = self.harvest(PagedSource(20, fail=3))
+        with self.assertRaises(ConnectionError):
+            next(batches)
+        self.assertEqual(
+            self.ids(self.harvest(PagedSource(20))), list(range(20)))
+
+    def test_stop_in_batch(self):
+        batches = self.harvest(PagedSource(20))
+        sent = self.ids([next(batches)])
+        # The second batch is lost while it is being sent
+        next(batches)
+        batches.close()
+        resumed = self.ids(self.harvest(PagedSource(20)))
+        # Nothing is lost, the last pages of the first batch may be sent
+        # again
+        self.assertLessEqual(resumed[0], len(sent))
+        self.assertEqual(sorted(set(sent + resumed)), list(range(20)))
+
+    def test_records_changed(self):
+        batches = self.harvest(PagedSource(20))
+        next(batches)
+        next(batches)
+        batches.close()
+        checkpoint = Checkpoint(self.store)
+        self.assertTrue(checkpoint.bind(PagedSource.uri, 'road', {'count': 3}))
+        self.assertEqual(checkpoint.state['params'], {'count': 3})
+        # The record before the cursor is not the last record committed
+        resumed = self.ids(self.harvest(PagedSource(20, first=100)))
+        self.assertEqual(resumed, list(range(100, 120)))
+
+    def test_done(self):
+        self.assertEqual(
+            self.ids(self.harvest(PagedSource(12))), list(range(12)))
+        self.assertEqual(list(self.store.directory.glob('*.json')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
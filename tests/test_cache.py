@@ -0,0 +1,88 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import asyncio
+from onegeo_manager.cache import CacheEntry
+from onegeo_manager.cache import DocumentCache
+from onegeo_manager.protocol import json
+import os
+import tempfile
+import time
+import unittest
+
+
+class RevalidationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = DocumentCache(maxsize=8, maxbytes=100, ttl=60)
+        self.cache.set('a', CacheEntry('A', etag='"a"', size=40,
+                                       stored=time.time() - 120))
+        self.cache.set('b', CacheEntry('B', etag='"b"', size=40))
+
+    def not_modified(self, headers):
+        self.assertEqual(headers, {'If-None-Match': '"a"'})
+        return None
+
+    def assert_revalidated(self, value):
+        self.assertEqual(value, 'A')
+        entry = self.cache.get('a')
+        self.assertTrue(self.cache.is_fresh(entry))
+        self.assertEqual(entry.size, 40)
+        self.assertEqual(self.cache.memory._bytes, 80)
+
+        # 120 bytes: the least recently used entry is evicted
+        self.cache.set('c', CacheEntry('C', size=40))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.memory._bytes, 80)
+
+    def test_fetch(self):
+        self.assert_revalidated(self.cache.fetch('a', self.not_modified))
+
+    def test_afetch(self):
+        async def load(headers):
+            return self.not_modified(headers)
+        self.assert_revalidated(asyncio.run(self.cache.afetch('a', load)))
+
+
+class DocumentCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'{"items": [{"id": 1}, {"id": 2}]}')
+        self.addCleanup(os.remove, self.path)
+        self.cache = DocumentCache()
+        self.source = json.Source('file://' + self.path, cache=self.cache)
+
+    def test_copies(self):
+        data = self.source._data
+        data['items'].pop()
+        data['other'] = True
+        self.assertEqual(
+            self.source._data, {'items': [{'id': 1}, {'id': 2}]})
+        self.assertEqual(self.cache.memory._bytes, os.path.getsize(self.path))
+
+    def test_modified(self):
+        self.source._data
+        with open(self.path, 'wb') as f:
+            f.write(b'{"items": [{"id": 3}]}')
+        self.assertEqual(self.source._data, {'items': [{'id': 3}]})
+        self.assertEqual(
+            self.cache.memory._bytes, os.path.getsize(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
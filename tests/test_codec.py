@@ -0,0 +1,93 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import json
+import mmap
+from onegeo_manager import codec
+import sys
+import tempfile
+import unittest
+
+
+FLOATS = [
+    0.0, -0.0, 0.1, 1.5, 1e-4, 1e-5, 1.5e-6, 1e-7, 1e-9, 1e-10, 1e15, 1e16,
+    -1e16, 1e17, 1e22, 1e23, 1.2345678901234568e20, 1.5e300, 5e-324,
+    sys.float_info.max, sys.float_info.min, 2 ** 53 + 0.0,
+    float('nan'), float('inf'), float('-inf')]
+
+
+def installed_backends():
+    backends = []
+    for name in codec.BACKENDS:
+        try:
+            codec.set_backend(name)
+        except ImportError:
+            continue
+        backends.append(name)
+    codec.set_backend()
+    return backends
+
+
+class CanonicalTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        codec.set_backend()
+
+    def expected(self, obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'),
+                          sort_keys=True).encode('utf-8')
+
+    def test_floats(self):
+        for backend in installed_backends():
+            codec.set_backend(backend)
+            for f in FLOATS:
+                with self.subTest(backend=backend, value=f):
+                    self.assertEqual(codec.canonical(f), self.expected(f))
+                    obj = {'b': [f, 'é'], 'a': {'z': f, 'y': 2 ** 70}}
+                    self.assertEqual(codec.canonical(obj), self.expected(obj))
+
+
+class LoadsTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        codec.set_backend()
+
+    def test_buffers(self):
+        document = {'id': 12345678901234567890, 'name': 'é', 'x': 1.5}
+        data = codec.BOM + json.dumps(document).encode('utf-8')
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for backend in installed_backends():
+                    codec.set_backend(backend)
+                    for buffer in (data, bytearray(data), memoryview(data), m):
+                        with self.subTest(backend=backend, type=type(buffer)):
+                            self.assertEqual(codec.loads(buffer), document)
+
+    def test_long_integers(self):
+        number = b'1' * codec.LONG_INTEGER
+        for offset in (0, codec.SCAN_SIZE - 5, 3 * codec.SCAN_SIZE - 1):
+            data = b' ' * offset + number
+            with self.subTest(offset=offset):
+                self.assertTrue(codec._has_long_integers(memoryview(data)))
+                self.assertFalse(codec._has_long_integers(data[:-1]))
+        self.assertFalse(codec._has_long_integers(
+            b' '.join([b'1' * (codec.LONG_INTEGER - 1)] * 10000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
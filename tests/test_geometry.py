@@ -0,0 +1,58 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from onegeo_manager.geometry import GeometryReducer
+import unittest
+
+
+SQUARE = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+
+
+class GeometryReducerTestCase(unittest.TestCase):
+
+    def test_collapsed_ring(self):
+        hole = [[0.001, 0.001], [0.002, 0.001], [0.002, 0.002],
+                [0.001, 0.001]]
+        geometry = {'type': 'Polygon', 'coordinates': [SQUARE, hole]}
+        reduced, stats = GeometryReducer(precision=2).process(geometry)
+        self.assertEqual(reduced['coordinates'][1], hole)
+        self.assertGreaterEqual(stats['saved'], 0)
+
+    def test_integers(self):
+        reducer = GeometryReducer(precision=3, tolerance=0.5)
+        for geometry in (
+                {'type': 'Polygon', 'coordinates': [SQUARE]},
+                {'type': 'LineString', 'coordinates': [[0, 0], [1, 0.5]]},
+                {'type': 'MultiPolygon', 'coordinates': [[
+                    [[0, 0], [1.123456, 0], [1, 1], [0, 0]]]]}):
+            with self.subTest(geometry=geometry):
+                reduced, stats = reducer.process(geometry)
+                self.assertGreaterEqual(stats['saved'], 0)
+        reduced, _ = reducer.process(
+            {'type': 'Polygon', 'coordinates': [SQUARE]})
+        self.assertEqual(reduced['coordinates'], [SQUARE])
+
+    def test_simplify(self):
+        line = [[0, 0], [1, 0.001], [2, 0], [3, 5], [4, 0]]
+        reduced, stats = GeometryReducer(tolerance=0.1).process(
+            {'type': 'LineString', 'coordinates': line})
+        self.assertEqual(reduced['coordinates'],
+                         [[0, 0], [2, 0], [3, 5], [4, 0]])
+        self.assertGreater(stats['saved'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
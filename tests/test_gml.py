@@ -0,0 +1,100 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from onegeo_manager import gml
+from onegeo_manager.exception import OGCExceptionReport
+import os
+import unittest
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_features(name, srs_name=None):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return list(gml.iter_features(f, srs_name=srs_name))
+
+
+class GML32TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.features = read_features(
+            'gml32_features.xml', srs_name='urn:ogc:def:crs:EPSG::4326')
+
+    def test_properties(self):
+        self.assertEqual([f['id'] for f in self.features],
+                         ['road.1', 'road.2', 'road.3'])
+        # gml:boundedBy is not a property
+        self.assertEqual(self.features[0]['properties'],
+                         {'name': 'A7', 'lanes': '4'})
+        self.assertEqual(self.features[2]['properties'], {'name': None})
+
+    def test_latlon_swap(self):
+        self.assertEqual(self.features[0]['geometry'], {
+            'type': 'LineString',
+            'coordinates': [[4.0, 45.0], [5.0, 46.0]]})
+
+    def test_multi_surface(self):
+        # EPSG:2154 is not swapped, whatever the default srsName is
+        self.assertEqual(self.features[1]['geometry'], {
+            'type': 'MultiPolygon',
+            'coordinates': [
+                [[[0.0, 0.0], [10.0, 0.0], [10.0, 10.0], [0.0, 10.0],
+                  [0.0, 0.0]],
+                 [[2.0, 2.0], [4.0, 2.0], [4.0, 4.0], [2.0, 2.0]]],
+                [[[20.0, 20.0], [30.0, 20.0], [30.0, 30.0],
+                  [20.0, 20.0]]]]})
+
+    def test_multi_curve(self):
+        self.assertEqual(self.features[2]['geometry'], {
+            'type': 'MultiLineString',
+            'coordinates': [[[4.0, 45.0], [5.0, 46.0]],
+                            [[6.0, 47.0], [7.0, 48.0]]]})
+
+
+class GML2TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.features = read_features('gml2_features.xml')
+
+    def test_coordinates(self):
+        # EPSG:4326 codes are in longitude/latitude order
+        self.assertEqual(self.features[0]['id'], 'road.1')
+        self.assertEqual(self.features[0]['geometry'], {
+            'type': 'Point', 'coordinates': [4.5, 45.5]})
+
+    def test_separators(self):
+        self.assertEqual(self.features[1]['geometry'], {
+            'type': 'LineString',
+            'coordinates': [[4.5, 45.5], [5.0, 46.0]]})
+
+    def test_multi_point(self):
+        self.assertEqual(self.features[2]['geometry'], {
+            'type': 'MultiPoint', 'coordinates': [[1.0, 2.0], [3.0, 4.0]]})
+
+
+class ExceptionReportTestCase(unittest.TestCase):
+
+    def test_exception_report(self):
+        with self.assertRaises(OGCExceptionReport) as context:
+            read_features('exception_report.xml')
+        self.assertEqual(context.exception.args, (
+            'InvalidParameterValue',
+            "Feature type 'ms:unknown' does not exist."))
+
+
+if __name__ == '__main__':
+    unittest.main()
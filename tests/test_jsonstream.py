@@ -0,0 +1,113 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import codecs
+import json
+from onegeo_manager import jsonstream
+import unittest
+
+
+DOCUMENT = (
+    '{"type": "FeatureCollection", "name": "caf\\u00e9 \\"\\\\\u00e9\\ud83d'
+    '\\ude00\U0001f600", "features": [{"id": 1, "properties": {"name": '
+    '"a, \\"b\\" [c]", "value": -12.5e+3}}, 12345, {"id": 2, "empty": {},'
+    ' "list": [[], [1, 2.25]], "nested": [{"id": 4}]}, "x\\ty", true, '
+    'null, 67890], "meta": {"layers": [{"id": 3}]}, "count": 1234567}'
+    ).encode('utf-8')
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def cuts(data):
+    """Yield `data` cut in two at every position, then byte by byte."""
+    for i in range(len(data) + 1):
+        yield [data[:i], data[i:]]
+    yield split(data, 1)
+
+
+class ArrayReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = json.loads(DOCUMENT.decode('utf-8'))
+
+    def read(self, chunks):
+        reader = jsonstream.ArrayReader('features')
+        items = list(jsonstream.iter_array(chunks, 'features', reader))
+        return items, reader.members
+
+    def test_cuts(self):
+        members = dict(self.expected)
+        features = members.pop('features')
+        for chunks in cuts(DOCUMENT):
+            with self.subTest(cut=len(chunks[0])):
+                self.assertEqual(self.read(chunks), (features, members))
+
+    def test_text_chunks(self):
+        text = DOCUMENT.decode('utf-8')
+        self.assertEqual(
+            self.read(split(text, 7))[0], self.expected['features'])
+
+    def test_bom(self):
+        for chunks in cuts(codecs.BOM_UTF8 + b'{"features": [1, 2]}'):
+            with self.subTest(cut=len(chunks[0])):
+                self.assertEqual(self.read(chunks), ([1, 2], {}))
+
+    def test_truncated(self):
+        reader = jsonstream.ArrayReader('features')
+        reader.feed(DOCUMENT[:-1])
+        with self.assertRaises(json.JSONDecodeError):
+            reader.close()
+
+
+class RecordReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = list(jsonstream.walk_records(
+            json.loads(DOCUMENT.decode('utf-8'))))
+
+    def test_cuts(self):
+        for chunks in cuts(DOCUMENT):
+            with self.subTest(cut=len(chunks[0])):
+                self.assertEqual(
+                    list(jsonstream.iter_records(chunks)), self.expected)
+
+    def test_paths(self):
+        self.assertEqual(
+            [(path, record.get('id')) for path, record in self.expected],
+            [(('features',), 1), (('features',), 2),
+             (('meta', 'layers'), 3)])
+
+    def test_bom(self):
+        document = codecs.BOM_UTF8 + b'[{"a": 1}, {"b": 2.5}]'
+        for chunks in cuts(document):
+            with self.subTest(cut=len(chunks[0])):
+                self.assertEqual(
+                    list(jsonstream.iter_records(chunks)),
+                    [((), {'a': 1}), ((), {'b': 2.5})])
+
+    def test_top_level_number(self):
+        # A number cut at the end of a chunk is not complete yet
+        for chunks in cuts(b'12345 6'):
+            with self.subTest(cut=len(chunks[0])):
+                with self.assertRaises(json.JSONDecodeError) as context:
+                    list(jsonstream.iter_records(chunks))
+                self.assertEqual(context.exception.msg, 'Extra data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import asyncio
+from onegeo_manager.exception import CircuitOpenError
+from onegeo_manager.transport import CircuitBreaker
+from onegeo_manager.transport import iter_prefetched
+from onegeo_manager.transport import RetryPolicy
+import requests
+import threading
+import time
+import unittest
+
+
+HOST = 'hostname:80'
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = RetryPolicy(
+            max_retries=0,
+            breaker=CircuitBreaker(threshold=1, recovery_time=0))
+
+    def refuse(self):
+        raise requests.ConnectionError()
+
+    def open_circuit(self):
+        with self.assertRaises(requests.ConnectionError):
+            self.policy.call(HOST, self.refuse)
+        self.assertEqual(self.policy.breaker.open_circuits(), [HOST])
+
+    def test_trial_success(self):
+        self.open_circuit()
+        self.assertEqual(self.policy.call(HOST, lambda: 'ok'), 'ok')
+        self.assertEqual(self.policy.breaker.open_circuits(), [])
+
+    def test_trial_failure(self):
+        self.open_circuit()
+        with self.assertRaises(requests.ConnectionError):
+            self.policy.call(HOST, self.refuse)
+        self.assertEqual(self.policy.breaker.open_circuits(), [HOST])
+
+    def test_trial_not_retried_exception(self):
+        self.open_circuit()
+
+        def decode():
+            raise ValueError('Not a JSON document.')
+        with self.assertRaises(ValueError):
+            self.policy.call(HOST, decode)
+        # The trial is over, the next call is let through
+        self.assertEqual(self.policy.call(HOST, lambda: 'ok'), 'ok')
+
+    def test_trial_cancelled(self):
+        self.open_circuit()
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        async def ok():
+            return 'ok'
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(self.policy.acall(HOST, cancelled))
+        self.assertEqual(asyncio.run(self.policy.acall(HOST, ok)), 'ok')
+
+    def test_open(self):
+        self.policy.breaker.recovery_time = 60
+        self.open_circuit()
+        with self.assertRaises(CircuitOpenError):
+            self.policy.call(HOST, lambda: 'ok')
+
+
+class Response(object):
+    """Streamed response whose chunks are read slowly."""
+
+    def __init__(self, count):
+        self.count = count
+        self.reading = False
+        self.read_after_close = False
+        self.closed = threading.Event()
+
+    def iter_content(self):
+        for i in range(self.count):
+            self.reading = True
+            time.sleep(0.01)
+            self.reading = False
+            if self.closed.is_set():
+                self.read_after_close = True
+            yield bytes([i])
+
+    def close(self):
+        self.closed_while_reading = self.reading
+        self.closed.set()
+
+
+class IterPrefetchedTestCase(unittest.TestCase):
+
+    def test_exhausted(self):
+        r = Response(5)
+        chunks = list(iter_prefetched(r.iter_content(), close=r.close))
+        self.assertEqual(chunks, [bytes([i]) for i in range(5)])
+        self.assertTrue(r.closed.wait(1))
+
+    def test_closed(self):
+        r = Response(100)
+        chunks = iter_prefetched(r.iter_content(), depth=2, close=r.close)
+        next(chunks)
+        chunks.close()
+        # The response is closed by the reader thread once it stops
+        self.assertTrue(r.closed.wait(1))
+        self.assertFalse(r.closed_while_reading)
+        self.assertFalse(r.read_after_close)
+
+    def test_error(self):
+        def fail():
+            yield b'a'
+            raise requests.ConnectionError()
+
+        closed = threading.Event()
+        with self.assertRaises(requests.ConnectionError):
+            list(iter_prefetched(fail(), close=closed.set))
+        self.assertTrue(closed.wait(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+# Copyright (c) 2017-2019 Neogeo-Technologies.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from datetime import date
+import json
+from onegeo_manager.protocol import wfs
+from onegeo_manager.transport import AsyncResponse
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+URL = 'http://hostname/wfs'
+
+
+def grid_features():
+    """Return features at the center of every cell of the 8x8 box, plus
+    features on the borders of the tiles, one of them without id."""
+    features = [
+        {'type': 'Feature', 'id': 'road.{0}.{1}'.format(x, y),
+         'properties': {}, 'geometry': {
+             'type': 'Point', 'coordinates': [x + 0.5, y + 0.5]}}
+        for y in range(8) for x in range(8)]
+    features.append({'type': 'Feature', 'id': 'road.center',
+                     'properties': {}, 'geometry': {
+                         'type': 'Point', 'coordinates': [4.0, 4.0]}})
+    features.append({'type': 'Feature', 'properties': {'name': 'no id'},
+                     'geometry': {'type': 'Point', 'coordinates': [4.0, 2.0]}})
+    return features
+
+
+class StubTransport(object):
+    """Serve a WFS 2.0.0 feature type, truncating every GetFeature
+    response to `cap` features whatever the count requested."""
+
+    def __init__(self, features, cap=None, delay=None):
+        self.features = features
+        self.cap = cap
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+        with open(os.path.join(FIXTURES, 'wfs_capabilities.xml'), 'rb') as f:
+            self.capabilities = f.read()
+
+    def response(self, content, content_type):
+        return AsyncResponse(URL, 200, {'Content-Type': content_type}, content)
+
+    def get(self, url, params=None, **kwargs):
+        with self._lock:
+            self.requests.append(dict(params))
+        if params['request'] == 'GetCapabilities':
+            return self.response(self.capabilities, 'text/xml')
+
+        features = self.features
+        if 'bbox' in params:
+            miny, minx, maxy, maxx = map(float, params['bbox'].split(',')[:4])
+            features = [
+                f for f in features
+                if minx <= f['geometry']['coordinates'][0] <= maxx
+                and miny <= f['geometry']['coordinates'][1] <= maxy]
+        if params.get('resulttype') == 'hits':
+            return self.response(
+                json.dumps({'numberMatched': len(features)}).encode(),
+                'application/json')
+
+        start = params.get('startindex', 0)
+        count = min(params['count'], self.cap or params['count'])
+        if self.delay:
+            self.delay(start)
+        return self.response(json.dumps({
+            'type': 'FeatureCollection',
+            'features': features[start:start + count]}).encode(),
+            'application/json; subtype=geojson')
+
+
+class SourceTestCase(unittest.TestCase):
+
+    def source(self, transport):
+        self.transport = transport
+        patcher = mock.patch.object(wfs, 'Transport', lambda: transport)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return wfs.Source(URL, cache=False)
+
+    def hits(self):
+        return [p for p in self.transport.requests
+                if p.get('resulttype') == 'hits']
+
+
+class TiledTestCase(SourceTestCase):
+
+    def setUp(self):
+        self.features = grid_features()
+
+    def harvest(self, cap, **kwargs):
+        source = self.source(StubTransport(self.features, cap=cap))
+        pages = list(source.get_collection(
+            'ms:road', tiled=True, by_page=True, **kwargs))
+        return [f for page in pages for f in page]
+
+    def assertComplete(self, features):
+        self.assertEqual(len(features), len(self.features))
+        self.assertCountEqual(
+            [f.get('id') for f in features],
+            [f.get('id') for f in self.features])
+
+    def test_subdivision(self):
+        features = self.harvest(10, max_features=10, prefetch=4)
+        self.assertComplete(features)
+        self.assertEqual(self.hits(), [])
+        self.assertTrue(all(p['count'] == 10 for p in self.transport.requests
+                            if p['request'] == 'GetFeature'))
+
+    def test_unknown_cap(self):
+        # The server silently truncates responses to 10 features
+        features = self.harvest(10, step=500)
+        self.assertComplete(features)
+        self.assertTrue(self.hits())
+
+    def test_single_tile(self):
+        features = self.harvest(None, step=500)
+        self.assertComplete(features)
+        self.assertEqual(len(self.hits()), 1)
+
+    def test_unseen(self):
+        seen = set()
+        feature = {'properties': {'name': 'no id'}}
+        self.assertEqual(
+            wfs.Source._unseen([{'id': 1}, feature], seen),
+            [{'id': 1}, feature])
+        self.assertEqual(
+            wfs.Source._unseen([{'id': 1}, dict(feature), {'id': 2}], seen),
+            [{'id': 2}])
+
+
+class PrefetchTestCase(SourceTestCase):
+
+    def test_order(self):
+        # Later pages are returned first
+        def delay(start):
+            time.sleep(0.02 * (20 - start) / 4)
+
+        source = self.source(
+            StubTransport(grid_features()[:20], delay=delay))
+        pages = list(source.get_collection(
+            'ms:road', step=4, prefetch=3, by_page=True))
+        self.assertEqual([len(p) for p in pages], [4] * 5)
+        self.assertEqual(
+            [f['id'] for p in pages for f in p],
+            [f['id'] for f in grid_features()[:20]])
+        self.assertEqual(len(self.hits()), 1)
+
+
+class NumberMatchedTestCase(unittest.TestCase):
+
+    def test_read(self):
+        for data, expected in [
+                ({'numberMatched': 5}, 5),
+                ({'wfs:FeatureCollection': {'@numberMatched': '7'}}, 7),
+                ({'FeatureCollection': {'@numberOfFeatures': '3'}}, 3),
+                ({'FeatureCollection': {'@numberMatched': 'unknown'}}, None),
+                ({'FeatureCollection': {}}, None)]:
+            with self.subTest(data=data):
+                self.assertEqual(
+                    wfs.Source._read_number_matched(data), expected)
+
+
+class FilterTestCase(unittest.TestCase):
+
+    def test_fes_2_0(self):
+        fes = wfs.Filter('2.0.0').property_is_greater_than(
+            'ms:modified', date(2019, 1, 2))
+        self.assertEqual(str(fes), (
+            '<fes:Filter xmlns:fes="http://www.opengis.net/fes/2.0" '
+            'xmlns:gml="http://www.opengis.net/gml/3.2">'
+            '<fes:PropertyIsGreaterThan>'
+            '<fes:ValueReference>ms:modified</fes:ValueReference>'
+            '<fes:Literal>2019-01-02</fes:Literal>'
+            '</fes:PropertyIsGreaterThan></fes:Filter>'))
+
+    def test_ogc_1_1_bbox(self):
+        fes = wfs.Filter('1.1.0').property_is_greater_than(
+            'ms:name', 'a < b & c').bbox(
+                (1, 2, 3, 4), 'urn:ogc:def:crs:EPSG::4326')
+        self.assertEqual(str(fes), (
+            '<ogc:Filter xmlns:ogc="http://www.opengis.net/ogc" '
+            'xmlns:gml="http://www.opengis.net/gml"><ogc:And>'
+            '<ogc:PropertyIsGreaterThan>'
+            '<ogc:PropertyName>ms:name</ogc:PropertyName>'
+            '<ogc:Literal>a &lt; b &amp; c</ogc:Literal>'
+            '</ogc:PropertyIsGreaterThan>'
+            '<ogc:BBOX><gml:Envelope srsName="urn:ogc:def:crs:EPSG::4326">'
+            '<gml:lowerCorner>2 1</gml:lowerCorner>'
+            '<gml:upperCorner>4 3</gml:upperCorner>'
+            '</gml:Envelope></ogc:BBOX></ogc:And></ogc:Filter>'))
+
+
+if __name__ == '__main__':
+    unittest.main()